@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+"""archive.py
+
+Hot/cold partitioning of conferences.
+
+Conferences whose end date (or start date, if they have none) has passed
+are flagged archived by a daily cron job. The default conference queries
+filter on archived == False, with archived leading their composite
+indexes, so they only scan live conferences; ConferenceQueryForms.archived
+selects the archive instead. Archived conferences don't count in the
+facet counts and are taken out of the search index. Conferences stored
+before the flag existed are written by the conference_archived migration
+(see migrations.py).
+
+"""
+
+from datetime import date
+
+from google.appengine.ext import ndb
+
+from models import Conference
+
+import facets
+import textsearch
+
+BATCH_SIZE = 200
+
+
+def isPast(conf):
+    """Return True if the conference is over."""
+    last_day = conf.endDate or conf.startDate
+    return bool(last_day and last_day < date.today())
+
+
+@ndb.transactional
+def _archive(key):
+    """Flag the conference archived; its facet count and search index
+    updates are enqueued in the same transaction. Return False if it
+    already was."""
+    conf = key.get()
+    if conf is None or conf.archived:
+        return False
+    old_cells = facets.counterCells(conf)
+    conf.archived = True
+    conf.put()
+    facets.enqueueUpdate(conf.key, old_cells, facets.counterCells(conf))
+    # archived conferences are taken out of the search index
+    textsearch.enqueueIndexing(conf.key)
+    return True
+
+
+def archivePastConferences():
+    """Flag the live conferences that are over; used by the daily cron."""
+    today = date.today()
+    queries = [
+        Conference.query(Conference.archived == False,  # noqa
+                         Conference.endDate < today),
+        # conferences without end date end on their start date
+        Conference.query(Conference.archived == False,  # noqa
+                         Conference.endDate == None,  # noqa
+                         Conference.startDate < today),
+    ]
+    archived = 0
+    for query in queries:
+        # page with cursors; the query results are eventually consistent
+        # and may still contain conferences archived by a previous batch,
+        # which _archive skips
+        cursor, more = None, True
+        while more:
+            keys, cursor, more = query.fetch_page(
+                BATCH_SIZE, start_cursor=cursor, keys_only=True)
+            # one at a time: the conferences of an organizer share an
+            # entity group
+            archived += sum(_archive(key) for key in keys)
+    return archived
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+
+"""assets.py
+
+Build step for the web client's static assets.
+
+Bundles the stylesheets and scripts listed between the `assets` markers of
+templates/index.html, plus the Angular partials (preloaded into
+$templateCache), into minified files named after their content hash under
+static/dist. Writes templates/index.dist.html pointing at the bundles and
+switches the generated block of app.yaml to serve them with a far-future
+expiration. Run before deploying; --clean restores the development setup.
+
+    $ python assets.py
+    $ python assets.py --clean
+
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DIST_DIR = 'static/dist'
+DIST_URL = '/dist'
+PARTIALS = 'static/partials/*.html'
+PARTIALS_URL = '/partials/'
+INDEX = 'templates/index.html'
+INDEX_DIST = 'templates/index.dist.html'
+APP_YAML = 'app.yaml'
+
+# url prefix -> directory, as mapped by the static handlers of app.yaml
+URL_DIRS = {
+    '/css/': 'static/bootstrap/css/',
+    '/js/': 'static/js/',
+}
+
+ASSETS_BLOCK_RE = re.compile(
+    r'<!-- assets:(css|js) (\w+) -->(.*?)<!-- endassets -->', re.DOTALL)
+HREF_RE = re.compile(r'(?:href|src)="([^"]+)"')
+
+YAML_BEGIN = '# BEGIN assets.py'
+YAML_END = '# END assets.py'
+YAML_BLOCK_RE = re.compile(
+    r'^%s.*?^%s\n' % (re.escape(YAML_BEGIN), re.escape(YAML_END)),
+    re.DOTALL | re.MULTILINE)
+
+DEV_HANDLERS = """\
+%s -- development handlers; `python assets.py` swaps in the bundles
+- url: /js
+  static_dir: static/js
+
+- url: /css
+  static_dir: static/bootstrap/css
+
+- url: /partials
+  static_dir: static/partials
+
+- url: /
+  static_files: templates/index.html
+  upload: templates/index\\.html
+  secure: always
+%s
+""" % (YAML_BEGIN, YAML_END)
+
+# bundle names change with their content, so they can be cached for good;
+# the page itself must be revalidated to pick up new bundle names
+DIST_HANDLERS = """\
+%s -- generated, `python assets.py --clean` restores the dev handlers
+- url: /dist
+  static_dir: static/dist
+  expiration: "365d"
+  http_headers:
+    Cache-Control: public, max-age=31536000, immutable
+
+- url: /
+  static_files: templates/index.dist.html
+  upload: templates/index\\.dist\\.html
+  secure: always
+  http_headers:
+    Cache-Control: no-cache
+%s
+""" % (YAML_BEGIN, YAML_END)
+
+
+def _path(name):
+    return os.path.join(ROOT, name)
+
+
+def _read(name):
+    with open(_path(name)) as f:
+        return f.read()
+
+
+def _write(name, content):
+    with open(_path(name), 'w') as f:
+        f.write(content)
+
+
+# - - - Minifiers - - - - - - - - - - - - - - - - - - - - - - - -
+#
+# Conservative on purpose: comments and indentation go, line breaks and
+# identifiers stay (Angular injects controller arguments by name).
+
+def _stripComments(source, line_comments):
+    """Remove /* */ (and // if line_comments) comments outside strings."""
+    out = []
+    i, n = 0, len(source)
+    while i < n:
+        c = source[i]
+        if c in '\'"':
+            j = i + 1
+            while j < n and source[j] != c:
+                j += 2 if source[j] == '\\' else 1
+            out.append(source[i:j + 1])
+            i = j + 1
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            i = n if end < 0 else end + 2
+        elif line_comments and source.startswith('//', i):
+            end = source.find('\n', i)
+            i = n if end < 0 else end
+        else:
+            out.append(c)
+            i += 1
+    return ''.join(out)
+
+
+def _stripLines(source):
+    return '\n'.join(line.strip() for line in source.splitlines()
+                     if line.strip())
+
+
+def minifyJs(source):
+    return _stripLines(_stripComments(source, True))
+
+
+def minifyCss(source):
+    css = re.sub(r'\s+', ' ', _stripComments(source, False))
+    css = re.sub(r' ?([{};,]) ?', r'\1', css)
+    # 'prop: value' -> 'prop:value', within declaration blocks only
+    css = re.sub(r'\{[^{}]*\}',
+                 lambda match: match.group(0).replace(': ', ':'), css)
+    return css.replace(';}', '}').strip()
+
+
+def minifyHtml(source):
+    return _stripLines(source)
+
+
+# - - - Bundles - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _sourceFile(url):
+    for prefix, directory in URL_DIRS.items():
+        if url.startswith(prefix):
+            return directory + url[len(prefix):]
+    raise ValueError('No static directory for %s' % url)
+
+
+def partialsJs():
+    """Return a script putting the partials into $templateCache under
+       the urls the routes load them from."""
+    puts = ['$templateCache.put(%s, %s);' % (
+                json.dumps(PARTIALS_URL + os.path.basename(name)),
+                json.dumps(minifyHtml(_read(name))))
+            for name in sorted(glob.glob(_path(PARTIALS)))]
+    return ("angular.module('conferenceApp').run(['$templateCache', "
+            "function ($templateCache) {\n%s\n}]);" % '\n'.join(puts))
+
+
+def bundleCss(urls):
+    css = '\n'.join(minifyCss(_read(_sourceFile(url))) for url in urls)
+    # @import is only valid at the top of a stylesheet
+    imports = re.findall(r'@import [^;]+;', css)
+    for rule in imports:
+        css = css.replace(rule, '')
+    return ''.join(imports) + css
+
+
+def bundleJs(urls):
+    scripts = [minifyJs(_read(_sourceFile(url))) for url in urls]
+    scripts.append(partialsJs())
+    return ';\n'.join(scripts) + ';\n'
+
+
+def writeBundle(name, kind, content):
+    """Write static/dist/<name>.<hash>.<kind>; return its url."""
+    digest = hashlib.md5(content).hexdigest()[:10]
+    filename = '%s.%s.%s' % (name, digest, kind)
+    _write(os.path.join(DIST_DIR, filename), content)
+    return '%s/%s' % (DIST_URL, filename)
+
+
+def build():
+    """Write the bundles & index.dist.html; return the bundle urls."""
+    clean()
+    os.makedirs(_path(DIST_DIR))
+    built = []
+
+    def replace(match):
+        kind, name, block = match.groups()
+        urls = HREF_RE.findall(block)
+        if kind == 'css':
+            url = writeBundle(name, kind, bundleCss(urls))
+            tag = '<link rel="stylesheet" href="%s">' % url
+        else:
+            url = writeBundle(name, kind, bundleJs(urls))
+            tag = '<script src="%s"></script>' % url
+        built.append(url)
+        return tag
+
+    _write(INDEX_DIST, ASSETS_BLOCK_RE.sub(replace, _read(INDEX)))
+    setHandlers(DIST_HANDLERS)
+    return built
+
+
+def clean():
+    """Remove the bundles & restore the development handlers."""
+    if os.path.isdir(_path(DIST_DIR)):
+        shutil.rmtree(_path(DIST_DIR))
+    if os.path.exists(_path(INDEX_DIST)):
+        os.remove(_path(INDEX_DIST))
+    setHandlers(DEV_HANDLERS)
+
+
+def setHandlers(block):
+    app_yaml = _read(APP_YAML)
+    if not YAML_BLOCK_RE.search(app_yaml):
+        raise ValueError('%s has no %s block' % (APP_YAML, YAML_BEGIN))
+    _write(APP_YAML, YAML_BLOCK_RE.sub(lambda match: block, app_yaml))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--clean', action='store_true',
+                        help='remove the bundles, serve the sources again')
+    args = parser.parse_args()
+
+    if args.clean:
+        clean()
+        print('Restored the development handlers.')
+        return
+    for url in build():
+        size = os.path.getsize(_path(DIST_DIR + url[len(DIST_URL):]))
+        print('%-40s %8d bytes' % (url, size))
+
+
+if __name__ == '__main__':
+    main()
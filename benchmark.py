@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+
+"""benchmark.py
+
+Offline benchmark for the ConferenceApi hot paths.
+
+Runs the endpoint methods against the App Engine testbed stubs on a
+synthetic data set and reports, per endpoint, latency percentiles,
+datastore RPCs per call and the time spent serializing entities into
+ProtoRPC forms.
+
+    $ APPENGINE_SDK=/path/to/google_appengine python benchmark.py \
+          --conferences 500 --sessions 20 --iterations 50
+
+"""
+
+import argparse
+import random
+import time
+from collections import defaultdict
+
+import localenv
+
+# datastore_v3 calls, grouped the way they are reported
+RPC_GROUPS = {
+    'Get': 'gets',
+    'RunQuery': 'queries',
+    'Next': 'queries',
+    'Put': 'puts',
+    'Commit': 'commits',
+}
+
+SERIALIZERS = ('_copyConferenceToForm', '_copySessionToForm',
+               '_copyProfileToForm', '_copySpeakerToForm')
+
+
+class Recorder(object):
+    """Collect datastore RPC counts and serialization time of one call."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.rpcs = defaultdict(int)
+        self.serialize = 0.0
+
+    def rpcHook(self, service, call, request, response):
+        group = RPC_GROUPS.get(call)
+        if group:
+            self.rpcs[group] += 1
+
+    def timed(self, func):
+        recorder = self
+
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                recorder.serialize += time.time() - start
+        return wrapper
+
+
+def percentile(values, pct):
+    """Return the pct-th percentile of the (unsorted) values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = int(round(pct / 100.0 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+# - - - Scenarios - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _scenarios(data):
+    """Return (name, callable(api, rng)) per benchmarked endpoint."""
+    import endpoints
+    from models import ConferenceQueryForm
+    from models import ConferenceQueryForms
+    from models import ProfileMiniForm
+    from protorpc import message_types
+    from conference import CONF_GET_REQUEST
+    from conference import CONF_LIST_REQUEST
+    from conference import SESSION_LIST_REQUEST
+    from conference import SESSION_TYPE_GET_REQUEST
+    from conference import SPEAKER_GET_REQUEST
+
+    void = message_types.VoidMessage()
+
+    def conf_key(rng):
+        return rng.choice(data.conference_keys).urlsafe()
+
+    def queryConferences(api, rng):
+        api.queryConferences(ConferenceQueryForms())
+
+    def queryConferencesByCity(api, rng):
+        api.queryConferences(ConferenceQueryForms(filters=[
+            ConferenceQueryForm(field='CITY', operator='EQ',
+                                value=rng.choice(localenv.CITIES))]))
+
+    def queryConferencesFields(api, rng):
+        api.queryConferences(ConferenceQueryForms(
+            fields=['name', 'city', 'startDate', 'websafeConferenceKey']))
+
+    def getConferencesCreated(api, rng):
+        api.getConferencesCreated(
+            CONF_LIST_REQUEST.combined_message_class())
+
+    def getConferencesToAttend(api, rng):
+        api.getConferencesToAttend(void)
+
+    def getProfile(api, rng):
+        api.getProfile(void)
+
+    def saveProfile(api, rng):
+        api.saveProfile(ProfileMiniForm(
+            displayName='Renamed %d' % rng.randint(0, 1000)))
+
+    def registration(api, rng):
+        request = CONF_GET_REQUEST.combined_message_class(
+            websafeConferenceKey=conf_key(rng))
+        try:
+            if api.registerForConference(request).data:
+                api.unregisterFromConference(request)
+        except endpoints.ServiceException:
+            # sold out or already registered; still a measured call
+            pass
+
+    def getConferenceSessions(api, rng):
+        api.getConferenceSessions(
+            SESSION_LIST_REQUEST.combined_message_class(
+                websafeConferenceKey=conf_key(rng)))
+
+    def getConferenceSessionsByType(api, rng):
+        api.getConferenceSessionsByType(
+            SESSION_TYPE_GET_REQUEST.combined_message_class(
+                websafeConferenceKey=conf_key(rng),
+                typeOfSession=rng.choice(localenv.SESSION_TYPES)))
+
+    def getSessionsBySpeaker(api, rng):
+        api.getSessionsBySpeaker(SPEAKER_GET_REQUEST.combined_message_class(
+            speakerName=rng.choice(data.speaker_names)))
+
+    def getAllSessionsInWishlist(api, rng):
+        api.getAllSessionsInWishlist(void)
+
+    return [
+        ('queryConferences', queryConferences),
+        ('queryConferences(city)', queryConferencesByCity),
+        ('queryConferences(fields)', queryConferencesFields),
+        ('getConferencesCreated', getConferencesCreated),
+        ('getConferencesToAttend', getConferencesToAttend),
+        ('getProfile', getProfile),
+        ('saveProfile', saveProfile),
+        ('register+unregister', registration),
+        ('getConferenceSessions', getConferenceSessions),
+        ('getConferenceSessionsByType', getConferenceSessionsByType),
+        ('getSessionsBySpeaker', getSessionsBySpeaker),
+        ('getAllSessionsInWishlist', getAllSessionsInWishlist),
+    ]
+
+
+def run(data, iterations, only=None):
+    """Run every scenario `iterations` times; return result rows."""
+    from google.appengine.api import apiproxy_stub_map
+    from google.appengine.ext import ndb
+    from conference import ConferenceApi
+
+    recorder = Recorder()
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Append(
+        'benchmark', recorder.rpcHook, 'datastore_v3')
+    for name in SERIALIZERS:
+        setattr(ConferenceApi, name,
+                recorder.timed(getattr(ConferenceApi, name)))
+
+    api = ConferenceApi()
+    rows = []
+    for name, scenario in _scenarios(data):
+        if only and name not in only:
+            continue
+        rng = random.Random(name)
+        latencies = []
+        rpcs = defaultdict(int)
+        serialize = 0.0
+        for i in range(iterations):
+            localenv.signIn(rng.choice(data.emails))
+            # every call starts like a fresh request
+            ndb.get_context().clear_cache()
+            recorder.reset()
+            start = time.time()
+            scenario(api, rng)
+            latencies.append((time.time() - start) * 1000)
+            for group, count in recorder.rpcs.items():
+                rpcs[group] += count
+            serialize += recorder.serialize * 1000
+        rows.append({
+            'endpoint': name,
+            'calls': iterations,
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'max': max(latencies),
+            'rpcs': dict((group, float(count) / iterations)
+                         for group, count in rpcs.items()),
+            'serialize': serialize / iterations,
+        })
+    return rows
+
+
+def report(rows):
+    header = ('%-30s %6s %8s %8s %8s %8s %6s %6s %6s %6s %9s' % (
+        'endpoint', 'calls', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms',
+        'gets', 'query', 'puts', 'commit', 'ser. ms'))
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        rpcs = row['rpcs']
+        print('%-30s %6d %8.2f %8.2f %8.2f %8.2f %6.1f %6.1f %6.1f %6.1f '
+              '%9.2f' % (
+                  row['endpoint'], row['calls'], row['p50'], row['p90'],
+                  row['p99'], row['max'], rpcs.get('gets', 0),
+                  rpcs.get('queries', 0), rpcs.get('puts', 0),
+                  rpcs.get('commits', 0), row['serialize']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--sdk', default=localenv.SDK_PATH,
+                        help='App Engine SDK directory')
+    parser.add_argument('--profiles', type=int, default=50)
+    parser.add_argument('--conferences', type=int, default=100)
+    parser.add_argument('--sessions', type=int, default=10,
+                        help='sessions per conference')
+    parser.add_argument('--speakers', type=int, default=40)
+    parser.add_argument('--registrations', type=int, default=5,
+                        help='conferences attended per profile')
+    parser.add_argument('--wishlist', type=int, default=10,
+                        help='wishlist sessions per profile')
+    parser.add_argument('--iterations', type=int, default=20,
+                        help='calls per endpoint')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', action='append',
+                        help='only run the named endpoint (repeatable)')
+    args = parser.parse_args()
+
+    localenv.fixSysPath(args.sdk)
+    with localenv.LocalEnvironment():
+        data = localenv.SyntheticData(
+            profiles=args.profiles, conferences=args.conferences,
+            sessions=args.sessions, speakers=args.speakers,
+            registrations=args.registrations, wishlist=args.wishlist,
+            seed=args.seed).generate()
+        report(run(data, args.iterations, args.only))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+"""compact.py
+
+Columnar encoding of the conference & session lists, sent instead of the
+items when a list endpoint is called with `compact` set.
+
+A CompactListForm holds a ColumnForm per form field, each with a value
+per item, instead of an object per item repeating every field name.
+Strings that repeat across items (speakers, types, cities, topics,
+highlights, the parent conference key of sessions) are sent once in the
+dictionary and referenced by index. Dates are sent as days since
+1970-01-01 and times as minutes since midnight. Missing values are NULL;
+string columns list the items without a value instead. Fields without a
+value in any item are left out. decodeCompact in
+static/js/controllers.js turns the columns back into form objects.
+
+"""
+
+from datetime import date
+from datetime import datetime
+
+from models import ColumnForm
+from models import CompactListForm
+from models import ConferenceForm
+from models import SessionForm
+
+NULL = -1
+
+# column encodings; STRING strings are the values ('' if none) and its
+# values the indexes of the items without one; LIST values are the
+# dictionary indexes of all items' lists, lengths the length of each
+# item's list
+STRING = 'string'
+DICT = 'dict'       # values: dictionary indexes
+LIST = 'list'
+INT = 'int'         # values: the values
+DATE = 'date'       # values: days since EPOCH
+TIME = 'time'       # values: minutes since midnight
+
+EPOCH = date(1970, 1, 1)
+
+# form class -> (field, encoding) in form field order
+COLUMNS = {
+    ConferenceForm: (
+        ('name', STRING),
+        ('description', STRING),
+        ('organizerUserId', DICT),
+        ('topics', LIST),
+        ('city', DICT),
+        ('startDate', DATE),
+        ('month', INT),
+        ('maxAttendees', INT),
+        ('seatsAvailable', INT),
+        ('endDate', DATE),
+        ('websafeConferenceKey', STRING),
+        ('organizerDisplayName', DICT),
+    ),
+    SessionForm: (
+        ('name', STRING),
+        ('highlights', LIST),
+        ('websafeConferenceKey', DICT),
+        ('speaker', DICT),
+        ('duration', INT),
+        ('type', DICT),
+        ('date', DATE),
+        ('startTime', TIME),
+        ('websafeSessionKey', STRING),
+    ),
+}
+
+
+def _days(value):
+    """Days since EPOCH of a 'YYYY-MM-DD' form value, NULL if none."""
+    try:
+        day = datetime.strptime(value[:10], '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return NULL
+    return (day - EPOCH).days
+
+
+def _minutes(value):
+    """Minutes since midnight of a 'HH:MM[:SS]' form value, NULL if none."""
+    try:
+        moment = datetime.strptime(value[:5], '%H:%M')
+    except (TypeError, ValueError):
+        return NULL
+    return moment.hour * 60 + moment.minute
+
+
+def encode(forms, form_cls):
+    """Return the CompactListForm of the forms (of form_cls)."""
+    dictionary = []
+    index = {}
+
+    def ref(value):
+        if value not in index:
+            index[value] = len(dictionary)
+            dictionary.append(value)
+        return index[value]
+
+    columns = []
+    for field, encoding in COLUMNS[form_cls]:
+        values = [getattr(form, field) for form in forms]
+        if all(value is None or value == [] for value in values):
+            continue
+        column = ColumnForm(field=field, encoding=encoding)
+        if encoding == STRING:
+            column.strings = [value or '' for value in values]
+            column.values = [i for i, value in enumerate(values)
+                             if value is None]
+        elif encoding == DICT:
+            column.values = [NULL if value is None else ref(value)
+                             for value in values]
+        elif encoding == LIST:
+            column.values = [ref(item) for value in values
+                             for item in value]
+            column.lengths = [len(value) for value in values]
+        elif encoding == INT:
+            column.values = [NULL if value is None else value
+                             for value in values]
+        elif encoding == DATE:
+            column.values = [_days(value) for value in values]
+        elif encoding == TIME:
+            column.values = [_minutes(value) for value in values]
+        columns.append(column)
+    return CompactListForm(count=len(forms), dictionary=dictionary,
+                           columns=columns)
+
+
+def listResponse(forms_cls, forms, compact=False, **fields):
+    """Return a forms_cls (ConferenceForms or SessionForms) message with
+       the forms as items, or as its compact encoding."""
+    if not compact:
+        return forms_cls(items=forms, **fields)
+    form_cls = forms_cls.field_by_name('items').type
+    return forms_cls(compact=encode(forms, form_cls), **fields)
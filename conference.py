@@ -1,3 +1,6 @@
+import functools
+import httplib
+from datetime import date
 from datetime import datetime
 
 import endpoints
@@ -5,11 +8,11 @@ from protorpc import messages
 from protorpc import message_types
 from protorpc import remote
 
+from google.appengine.api import datastore_errors
 from google.appengine.api import memcache
 from google.appengine.api import taskqueue
 from google.appengine.ext import ndb
 
-from models import ConflictException
 from models import Profile
 from models import ProfileMiniForm
 from models import ProfileForm
@@ -19,10 +22,16 @@ from models import Conference
 from models import ConferenceForm
 from models import ConferenceForms
 from models import ConferenceQueryForms
+from models import DashboardForm
+from models import FacetCountForm
+from models import FacetCountForms
 from models import TeeShirtSize
+from models import MEMCACHE_CALENDAR_TPL
 from models import Session
 from models import SessionForm
 from models import SessionForms
+from models import SessionConflictForm
+from models import SessionConflictForms
 from models import Speaker
 from models import SpeakerForm
 
@@ -31,7 +40,30 @@ from settings import ANDROID_CLIENT_ID
 from settings import IOS_CLIENT_ID
 from settings import ANDROID_AUDIENCE
 
+from utils import formValues
+from utils import getChangeToken
+from utils import getOrganizerNames
 from utils import getUserId
+from utils import updateEntity
+
+from workers import MEMCACHE_ANNOUNCEMENTS_KEY
+from workers import MEMCACHE_FEATURE_KEY
+from workers import MEMCACHE_UPCOMING_KEY
+from workers import cacheUpcomingConferences
+
+from instrumentation import instrumented
+from instrumentation import serializer
+import archive
+import compact
+import contention
+import facets
+import icalfeed
+import idempotency
+import ratelimit
+import schedule
+import sessiondays
+import sessionquery
+import textsearch
 
 # !/usr/bin/env python
 
@@ -50,11 +82,6 @@ __author__ = 'wesc+api@google.com (Wesley Chun)'
 
 EMAIL_SCOPE = endpoints.EMAIL_SCOPE
 API_EXPLORER_CLIENT_ID = endpoints.API_EXPLORER_CLIENT_ID
-MEMCACHE_ANNOUNCEMENTS_KEY = 'RECENT_ANNOUNCEMENTS'
-ANNOUNCEMENT_TPL = ('Last chance to attend! The following conferences '
-                    'are nearly sold out: %s')
-MEMCACHE_FEATURE_KEY = 'FEATURED_SPEAKER'
-FEATURED_SPEAKER_TPL = ('The featured speaker is: %s (Sessions: %s)')
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 DEFAULTS_CONF = {
@@ -96,13 +123,31 @@ CONF_POST_REQUEST = endpoints.ResourceContainer(
     websafeConferenceKey=messages.StringField(1)
 )
 
+CONF_LIST_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    fields=messages.StringField(1, repeated=True),
+    compact=messages.BooleanField(2, default=False)
+)
+
+COMPACT_LIST_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    compact=messages.BooleanField(1, default=False)
+)
+
 SESSION_GET_REQUEST = endpoints.ResourceContainer(
     websafeSessionKey=messages.StringField(1, required=True)
 )
 
+SESSION_LIST_REQUEST = endpoints.ResourceContainer(
+    websafeConferenceKey=messages.StringField(1, required=True),
+    fields=messages.StringField(2, repeated=True),
+    compact=messages.BooleanField(3, default=False)
+)
+
 SESSION_TYPE_GET_REQUEST = endpoints.ResourceContainer(
     websafeConferenceKey=messages.StringField(1, required=True),
-    typeOfSession=messages.StringField(2)
+    typeOfSession=messages.StringField(2),
+    compact=messages.BooleanField(3, default=False)
 )
 
 SESSION_TIME_EXCLTYPES_GET_REQUEST = endpoints.ResourceContainer(
@@ -116,10 +161,178 @@ SESSION_POST_REQUEST = endpoints.ResourceContainer(
     websafeSessionKey=messages.StringField(1)
 )
 
+CONF_CREATE_REQUEST = endpoints.ResourceContainer(
+    ConferenceForm,
+    idempotencyKey=messages.StringField(1)
+)
+
+SESSION_CREATE_REQUEST = endpoints.ResourceContainer(
+    SessionForm,
+    idempotencyKey=messages.StringField(1)
+)
+
+SPEAKER_CREATE_REQUEST = endpoints.ResourceContainer(
+    SpeakerForm,
+    idempotencyKey=messages.StringField(1)
+)
+
 SPEAKER_GET_REQUEST = endpoints.ResourceContainer(
     speakerName=messages.StringField(1, required=True),
 )
 
+SPEAKER_SESSIONS_REQUEST = endpoints.ResourceContainer(
+    speakerName=messages.StringField(1, required=True),
+    compact=messages.BooleanField(2, default=False),
+)
+
+CONF_DATE_RANGE_REQUEST = endpoints.ResourceContainer(
+    fromDate=messages.StringField(1),
+    toDate=messages.StringField(2),
+    limit=messages.IntegerField(3, default=20),
+    pageToken=messages.StringField(4),
+)
+
+SESSION_QUERY_REQUEST = endpoints.ResourceContainer(
+    websafeConferenceKey=messages.StringField(1, required=True),
+    fromDate=messages.StringField(2),
+    toDate=messages.StringField(3),
+    fromTime=messages.StringField(4),
+    toTime=messages.StringField(5),
+    minDuration=messages.IntegerField(6),
+    maxDuration=messages.IntegerField(7),
+    includeTypes=messages.StringField(8, repeated=True),
+    excludeTypes=messages.StringField(9, repeated=True),
+    speaker=messages.StringField(10),
+    limit=messages.IntegerField(11, default=20),
+    pageToken=messages.StringField(12),
+    compact=messages.BooleanField(13, default=False),
+)
+
+SESSIONS_HAPPENING_REQUEST = endpoints.ResourceContainer(
+    date=messages.StringField(1),
+    fromTime=messages.StringField(2),
+    toTime=messages.StringField(3),
+    compact=messages.BooleanField(4, default=False),
+)
+
+SEARCH_REQUEST = endpoints.ResourceContainer(
+    query=messages.StringField(1, required=True),
+    limit=messages.IntegerField(2, default=20),
+    pageToken=messages.StringField(3),
+)
+
+MAX_PAGE_SIZE = 100
+# entities scanned per datastore batch by queries filtered in memory
+SCAN_BATCH = 50
+
+# properties loaded by projection queries when the requested fields allow
+# it; each projection is backed by an index in index.yaml
+CONFERENCE_PROJECTION = ('name', 'organizerUserId', 'city', 'startDate',
+                         'endDate', 'month', 'maxAttendees', 'seatsAvailable')
+SESSION_PROJECTION = ('name', 'speaker', 'type', 'duration', 'date',
+                      'startTime')
+# form fields that are not copied from an entity property
+DERIVED_FIELDS = ('websafeConferenceKey', 'websafeSessionKey',
+                  'organizerDisplayName')
+
+
+class ConflictException(endpoints.ServiceException):
+    """ConflictException -- exception mapped to HTTP 409 response"""
+    http_status = httplib.CONFLICT
+
+
+class TooManyRequestsException(endpoints.ServiceException):
+    """TooManyRequestsException -- exception mapped to HTTP 429 response"""
+    http_status = 429
+
+
+# form class -> names of its fields, in field number order; filled on
+# first use or by buildSerializerTables() during warmup
+_FORM_FIELD_NAMES = {}
+
+
+def formFieldNames(form_cls):
+    """Return the field names of a ProtoRPC form class."""
+    names = _FORM_FIELD_NAMES.get(form_cls)
+    if names is None:
+        names = tuple(field.name for field in sorted(
+            form_cls.all_fields(), key=lambda field: field.number))
+        _FORM_FIELD_NAMES[form_cls] = names
+    return names
+
+
+def buildSerializerTables():
+    """Precompute the field name tables used by the _copy*ToForm
+       serializers."""
+    for form_cls in (ConferenceForm, ProfileForm, SessionForm, SpeakerForm):
+        formFieldNames(form_cls)
+
+
+def withChangeToken(func):
+    """Set the changeToken of the endpoint method's response, which lets
+       clients keep cached responses until the token changes."""
+    @functools.wraps(func)
+    def wrapper(self, request):
+        # set by _getProfileFromUser, to reuse the profile for the token
+        self._profile = None
+        response = func(self, request)
+        response.changeToken = self._getChangeToken()
+        return response
+    return wrapper
+
+
+def throttled(func):
+    """Reject calls beyond the endpoint's rate limits (see ratelimit.py)
+       before the method touches the datastore."""
+    @functools.wraps(func)
+    def wrapper(self, request):
+        user = endpoints.get_current_user()
+        if not ratelimit.admit(func.__name__,
+                               getUserId(user) if user else None,
+                               getattr(request, 'websafeConferenceKey',
+                                       None)):
+            raise TooManyRequestsException(
+                'Too many requests, please try again later.')
+        return func(self, request)
+    return wrapper
+
+
+def idempotent(form_cls):
+    """Make a create endpoint method replay its first response for
+       requests with the same idempotencyKey (see idempotency.py); the
+       method is called with the request copied into a form_cls."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, request):
+            form = form_cls(**dict((name, getattr(request, name))
+                                   for name in formFieldNames(form_cls)))
+            if not request.idempotencyKey:
+                return func(self, form)
+
+            # keys are scoped per user: anonymous callers could replay
+            # each other's results
+            user = endpoints.get_current_user()
+            if not user:
+                raise endpoints.UnauthorizedException(
+                    'Authorization required to use an idempotencyKey')
+            result_id = idempotency.scope(
+                func.__name__, getUserId(user), request.idempotencyKey)
+            response = idempotency.getResult(result_id, form_cls)
+            if response is not None:
+                return response
+            if not idempotency.claim(result_id):
+                raise ConflictException(
+                    'A request with this idempotencyKey is in progress.')
+            try:
+                response = func(self, form)
+            except Exception:
+                idempotency.release(result_id)
+                raise
+            idempotency.storeResult(result_id, response)
+            return response
+        return wrapper
+    return decorator
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 
@@ -134,19 +347,25 @@ class ConferenceApi(remote.Service):
 
 # - - - Conference objects - - - - - - - - - - - - - - - - -
 
-    def _copyConferenceToForm(self, conf, displayName):
-        """Copy relevant fields from Conference to ConferenceForm."""
+    @serializer
+    def _copyConferenceToForm(self, conf, displayName, fields=None):
+        """Copy relevant fields (all or the given ones) from Conference
+           to ConferenceForm."""
         cf = ConferenceForm()
-        for field in cf.all_fields():
-            if hasattr(conf, field.name):
+        for name in formFieldNames(ConferenceForm):
+            if fields and name not in fields:
+                continue
+            if hasattr(conf, name):
                 # convert Date to date string; just copy others
-                if field.name.endswith('Date'):
-                    setattr(cf, field.name, str(getattr(conf, field.name)))
+                # missing dates are left out, as in compact lists
+                if name.endswith('Date'):
+                    if getattr(conf, name) is not None:
+                        setattr(cf, name, str(getattr(conf, name)))
                 else:
-                    setattr(cf, field.name, getattr(conf, field.name))
-            elif field.name == "websafeConferenceKey":
-                setattr(cf, field.name, conf.key.urlsafe())
-        if displayName:
+                    setattr(cf, name, getattr(conf, name))
+            elif name == "websafeConferenceKey":
+                setattr(cf, name, conf.key.urlsafe())
+        if displayName and (not fields or 'organizerDisplayName' in fields):
             setattr(cf, 'organizerDisplayName', displayName)
         cf.check_initialized()
         return cf
@@ -202,24 +421,30 @@ class ConferenceApi(remote.Service):
 
         # create Conference, send email to organizer confirming
         # creation of Conference & return (modified) ConferenceForm
-        Conference(**data).put()
+        conf = Conference(**data)
+        conf.archived = archive.isPast(conf)
+        self._putNewConference(conf)
+        textsearch.enqueueIndexing(c_key)
+        taskqueue.add(url='/tasks/set_upcoming_conferences')
         taskqueue.add(params={'email': user.email(),
                               'conferenceInfo': repr(request)},
                       url='/tasks/send_confirmation_email'
                       )
         return request
 
-    @ndb.transactional()
+    @ndb.transactional
+    def _putNewConference(self, conf):
+        """Put a new conference & enqueue its facet counts with it."""
+        conf.put()
+        facets.enqueueUpdate(conf.key, set(), facets.counterCells(conf))
+
+    @contention.transactional('websafeConferenceKey')
     def _updateConferenceObject(self, request):
         user = endpoints.get_current_user()
         if not user:
             raise endpoints.UnauthorizedException('Authorization required')
         user_id = getUserId(user)
 
-        # copy ConferenceForm/ProtoRPC Message into dict
-        data = {field.name: getattr(request, field.name)
-                for field in request.all_fields()}
-
         # update existing conference
         conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
         # check that conference exists
@@ -233,25 +458,39 @@ class ConferenceApi(remote.Service):
             raise endpoints.ForbiddenException(
                 'Only the owner can update the conference.')
 
+        # remember the facet counters to update the counts afterwards
+        old_cells = facets.counterCells(conf)
+
         # Not getting all the fields, so don't create a new object; just
-        # copy relevant fields from ConferenceForm to Conference object
-        for field in request.all_fields():
-            data = getattr(request, field.name)
-            # only copy fields where we get data
-            if data not in (None, []):
-                # special handling for dates (convert string to Date)
-                if field.name in ('startDate', 'endDate'):
-                    data = datetime.strptime(data, "%Y-%m-%d").date()
-                    if field.name == 'startDate':
-                        conf.month = data.month
-                # write to Conference object
-                setattr(conf, field.name, data)
-        conf.put()
+        # copy the fields we get data for from ConferenceForm
+        values = formValues(request, conf)
+        # special handling for dates (convert string to Date)
+        for name in ('startDate', 'endDate'):
+            if name in values:
+                values[name] = datetime.strptime(
+                    values[name], "%Y-%m-%d").date()
+        if 'startDate' in values and 'month' not in values:
+            values['month'] = values['startDate'].month
+
+        # only write (and reindex) if something actually changed
+        changed = updateEntity(conf, values)
+        if updateEntity(conf, {'archived': archive.isPast(conf)}):
+            changed = True
+        if changed:
+            conf.put()
+            textsearch.enqueueIndexing(conf.key)
+            facets.enqueueUpdate(conf.key, old_cells,
+                                 facets.counterCells(conf))
+            taskqueue.add(url='/tasks/set_upcoming_conferences',
+                          transactional=True)
         prof = ndb.Key(Profile, user_id).get()
         return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
 
-    @endpoints.method(ConferenceForm, ConferenceForm, path='conference',
+    @endpoints.method(CONF_CREATE_REQUEST, ConferenceForm,
+                      path='conference',
                       http_method='POST', name='createConference')
+    @instrumented
+    @idempotent(ConferenceForm)
     def createConference(self, request):
         """Create new conference."""
         return self._createConferenceObject(request)
@@ -259,6 +498,7 @@ class ConferenceApi(remote.Service):
     @endpoints.method(CONF_POST_REQUEST, ConferenceForm,
                       path='conference/{websafeConferenceKey}',
                       http_method='PUT', name='updateConference')
+    @instrumented
     def updateConference(self, request):
         """Update conference w/provided fields & return w/updated info."""
         return self._updateConferenceObject(request)
@@ -266,6 +506,7 @@ class ConferenceApi(remote.Service):
     @endpoints.method(CONF_GET_REQUEST, ConferenceForm,
                       path='conference/{websafeConferenceKey}',
                       http_method='GET', name='getConference')
+    @instrumented
     def getConference(self, request):
         """Return requested conference (by websafeConferenceKey)."""
         # get Conference object from request; bail if not found
@@ -274,30 +515,62 @@ class ConferenceApi(remote.Service):
         # return ConferenceForm
         return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
 
-    @endpoints.method(message_types.VoidMessage, ConferenceForms,
+    def _fetchEntities(self, query, projection=None):
+        """Run the query keys-only and load the entities with get_multi,
+           which is served from the ndb cache (see models.CACHE_POLICIES);
+           projection queries return their (partial) entities directly."""
+        if projection:
+            return query.fetch(projection=projection)
+        return [entity for entity in
+                ndb.get_multi(query.fetch(keys_only=True)) if entity]
+
+    def _getProjection(self, form_cls, fields, projection):
+        """Check the requested form fields; return the properties to
+           project on if they cover the fields, None otherwise."""
+        if not fields:
+            return None
+        unknown = set(fields) - set(f.name for f in form_cls.all_fields())
+        if unknown:
+            raise endpoints.BadRequestException(
+                'Unknown fields: %s' % ', '.join(sorted(unknown)))
+        if set(fields) - set(DERIVED_FIELDS) <= set(projection):
+            return list(projection)
+        return None
+
+    @endpoints.method(CONF_LIST_REQUEST, ConferenceForms,
                       path='getConferencesCreated',
                       http_method='POST', name='getConferencesCreated')
+    @instrumented
+    @withChangeToken
     def getConferencesCreated(self, request):
-        """Return conferences created by user."""
+        """Return conferences created by user (optionally only the
+           requested fields)."""
         # make sure user is authed
         user = endpoints.get_current_user()
         if not user:
             raise endpoints.UnauthorizedException('Authorization required')
         user_id = getUserId(user)
+        projection = self._getProjection(ConferenceForm, request.fields,
+                                         CONFERENCE_PROJECTION)
 
         # create ancestor query for all key matches for this user
-        confs = Conference.query(ancestor=ndb.Key(Profile, user_id))
+        confs = self._fetchEntities(
+            Conference.query(ancestor=ndb.Key(Profile, user_id)), projection)
         prof = ndb.Key(Profile, user_id).get()
+        self._profile = prof
         # return set of ConferenceForm objects per Conference
-        return ConferenceForms(
-            items=[self._copyConferenceToForm(conf,
-                                              getattr(prof, 'displayName'))
-                   for conf in confs]
-        )
+        return compact.listResponse(
+            ConferenceForms,
+            [self._copyConferenceToForm(conf,
+                                        getattr(prof, 'displayName'),
+                                        request.fields)
+             for conf in confs],
+            request.compact)
 
     def _getQuery(self, request):
         """Return formatted query from the submitted filters."""
-        q = Conference.query()
+        # live conferences unless the archive is asked for
+        q = Conference.query(Conference.archived == request.archived)
         inequality_filter, filters = self._formatFilters(request.filters)
 
         # If exists, sort on inequality filter first
@@ -353,27 +626,158 @@ class ConferenceApi(remote.Service):
                       path='queryConferences',
                       http_method='POST',
                       name='queryConferences')
+    @instrumented
+    @withChangeToken
     def queryConferences(self, request):
-        """Query for conferences."""
-        conferences = self._getQuery(request)
+        """Query for conferences (optionally only the requested fields)."""
+        projection = self._getProjection(ConferenceForm, request.fields,
+                                         CONFERENCE_PROJECTION)
+        # filtered projection queries would need an index per filter
+        # combination; trim the forms only
+        if request.filters:
+            projection = None
+        conferences = self._fetchEntities(self._getQuery(request),
+                                          projection)
 
         # need to fetch organiser displayName from profiles
-        # get all keys and use get_multi for speed
-        organisers = [(ndb.Key(Profile, conf.organizerUserId))
-                      for conf in conferences]
-        profiles = ndb.get_multi(organisers)
-
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
+        names = getOrganizerNames(conferences)
 
         # return individual ConferenceForm object per Conference
+        return compact.listResponse(
+            ConferenceForms,
+            [self._copyConferenceToForm(conf,
+                                        names[conf.organizerUserId],
+                                        request.fields)
+             for conf in conferences],
+            request.compact)
+
+    def _parseDate(self, value, name):
+        """Return the Date of a 'YYYY-MM-DD' request field or None."""
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value[:10], "%Y-%m-%d").date()
+        except ValueError:
+            raise endpoints.BadRequestException(
+                "'%s' must be a date formatted YYYY-MM-DD." % name)
+
+    def _parseTime(self, value, name):
+        """Return the Time of a 'HH:MM' request field or None."""
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value[:5], "%H:%M").time()
+        except ValueError:
+            raise endpoints.BadRequestException(
+                "'%s' must be a time formatted HH:MM." % name)
+
+    @endpoints.method(CONF_DATE_RANGE_REQUEST, ConferenceForms,
+                      path='queryConferencesByDate',
+                      http_method='GET', name='queryConferencesByDate')
+    @instrumented
+    def queryConferencesByDate(self, request):
+        """Return conferences taking place (at least partly) between
+           fromDate and toDate (both optional, inclusive), ordered by end
+           date. Conferences without an end date aren't returned."""
+        from_date = self._parseDate(request.fromDate, 'fromDate')
+        to_date = self._parseDate(request.toDate, 'toDate')
+        if not 0 < request.limit <= MAX_PAGE_SIZE:
+            raise endpoints.BadRequestException(
+                'limit must be between 1 and %d.' % MAX_PAGE_SIZE)
+
+        # only one property can have inequality filters: the end date is
+        # filtered by the query, the start date in memory
+        q = Conference.query()
+        if from_date:
+            q = q.filter(Conference.endDate >= from_date)
+        q = q.order(Conference.endDate)
+        try:
+            cursor = ndb.Cursor(urlsafe=request.pageToken)
+        except datastore_errors.BadValueError:
+            raise endpoints.BadRequestException('Invalid pageToken.')
+        it = q.iter(start_cursor=cursor, produce_cursors=True,
+                    batch_size=max(request.limit, SCAN_BATCH))
+        conferences = []
+        for conf in it:
+            # without fromDate the query also has the conferences without
+            # an end date, sorted first
+            if conf.endDate is None:
+                continue
+            if to_date and not (conf.startDate and
+                                conf.startDate <= to_date):
+                continue
+            conferences.append(conf)
+            if len(conferences) == request.limit:
+                break
+        more = len(conferences) == request.limit and it.has_next()
+
+        names = getOrganizerNames(conferences)
         return ConferenceForms(
-                items=[self._copyConferenceToForm(conf,
-                                                  names[conf.organizerUserId])
-                       for conf in conferences]
-        )
+            items=[self._copyConferenceToForm(
+                       conf, names.get(conf.organizerUserId))
+                   for conf in conferences],
+            nextPageToken=it.cursor_after().urlsafe() if more else None)
+
+    @endpoints.method(message_types.VoidMessage, ConferenceForms,
+                      path='conferences/upcoming',
+                      http_method='GET', name='getUpcomingConferences')
+    @instrumented
+    @withChangeToken
+    def getUpcomingConferences(self, request):
+        """Return upcoming conferences, sorted by start date, from
+           memcache; conferences that have started are trimmed."""
+        return ConferenceForms(
+            items=self._getUpcomingForms(memcache.get(MEMCACHE_UPCOMING_KEY)))
+
+    def _getUpcomingForms(self, upcoming):
+        """Return ConferenceForm objects of the cached upcoming list,
+           rebuilding it if missing & trimming conferences that have
+           started."""
+        if upcoming is None:
+            upcoming = cacheUpcomingConferences()
+
+        today = date.today()
+        items = [(conf, name) for conf, name in upcoming
+                 if conf.startDate >= today]
+        if len(items) < len(upcoming):
+            memcache.set(MEMCACHE_UPCOMING_KEY, items)
+        return [self._copyConferenceToForm(conf, name)
+                for conf, name in items]
+
+    @endpoints.method(ConferenceQueryForms, FacetCountForms,
+                      path='conferenceFacets',
+                      http_method='POST',
+                      name='getConferenceFacets')
+    @instrumented
+    @withChangeToken
+    def getConferenceFacets(self, request):
+        """Return the number of conferences per city, topic, month and
+           attendee bucket, restricted by the filter if there is one."""
+        counts = facets.getCounts(self._getFacetScope(request))
+        return FacetCountForms(
+            items=[FacetCountForm(facet=facet, value=value, count=count)
+                   for facet in facets.FACETS
+                   for value, count in sorted(counts[facet].items())])
+
+    def _getFacetScope(self, request):
+        """Return the facet counter scope of the query; the counters
+           answer a single equality filter on city, topic or month."""
+        if not request.filters:
+            return facets.scope(request.archived)
+        filtr = request.filters[0]
+        if (len(request.filters) > 1 or filtr.operator != 'EQ' or
+                filtr.field not in facets.FILTER_FACETS):
+            raise endpoints.BadRequestException(
+                'Facet counts can only be combined with a single equality '
+                'filter on %s.' % ', '.join(facets.FILTER_FACETS))
+        value = filtr.value
+        if filtr.field == 'MONTH':
+            try:
+                value = str(int(value))
+            except (TypeError, ValueError):
+                raise endpoints.BadRequestException(
+                    'MONTH must be a number.')
+        return facets.scope(request.archived, filtr.field, value)
 
     def _getConf(self, websafeConferenceKey):
         """Returns Conference object; bail if not found"""
@@ -388,18 +792,19 @@ class ConferenceApi(remote.Service):
 
 # - - - Profile objects - - - - - - - - - - - - - - - - - - -
 
+    @serializer
     def _copyProfileToForm(self, prof):
         """Copy relevant fields from Profile to ProfileForm."""
         # copy relevant fields from Profile to ProfileForm
         pf = ProfileForm()
-        for field in pf.all_fields():
-            if hasattr(prof, field.name):
+        for name in formFieldNames(ProfileForm):
+            if hasattr(prof, name):
                 # convert t-shirt string to Enum; just copy others
-                if field.name == 'teeShirtSize':
-                    setattr(pf, field.name,
-                            getattr(TeeShirtSize, getattr(prof, field.name)))
+                if name == 'teeShirtSize':
+                    setattr(pf, name,
+                            getattr(TeeShirtSize, getattr(prof, name)))
                 else:
-                    setattr(pf, field.name, getattr(prof, field.name))
+                    setattr(pf, name, getattr(prof, name))
         pf.check_initialized()
         return pf
 
@@ -425,6 +830,7 @@ class ConferenceApi(remote.Service):
             )
             profile.put()
 
+        self._profile = profile
         return profile      # return Profile
 
     def _doProfile(self, save_request=None):
@@ -432,74 +838,131 @@ class ConferenceApi(remote.Service):
         # get user Profile
         prof = self._getProfileFromUser()
 
-        # if saveProfile(), process user-modifyable fields
+        # if saveProfile(), process user-modifyable fields;
+        # one write at most, none if nothing changed
         if save_request:
-            for field in ('displayName', 'teeShirtSize'):
-                if hasattr(save_request, field):
-                    val = getattr(save_request, field)
-                    if val:
-                        setattr(prof, field, str(val))
-                        # if field == 'teeShirtSize':
-                        #    setattr(prof, field, str(val).upper())
-                        # else:
-                        #    setattr(prof, field, val)
-                        prof.put()
+            values = dict((name, str(val)) for name, val in
+                          formValues(save_request, prof).items() if val)
+            if updateEntity(prof, values):
+                prof.put()
 
         # return ProfileForm
         return self._copyProfileToForm(prof)
 
+    def _getChangeToken(self):
+        """Return the change token of the user (see utils.getChangeToken),
+           reusing the profile the endpoint method loaded."""
+        prof = self._profile
+        if prof is None:
+            user = endpoints.get_current_user()
+            prof = ndb.Key(Profile, getUserId(user)).get() if user else None
+        return getChangeToken(prof)
+
     @endpoints.method(message_types.VoidMessage, ProfileForm,
                       path='profile', http_method='GET', name='getProfile')
+    @instrumented
+    @withChangeToken
     def getProfile(self, request):
         """Return user profile."""
         return self._doProfile()
 
     @endpoints.method(ProfileMiniForm, ProfileForm,
                       path='profile', http_method='POST', name='saveProfile')
+    @instrumented
+    @throttled
+    @withChangeToken
     def saveProfile(self, request):
         """Update & return user profile."""
 
         return self._doProfile(request)
 
+    @endpoints.method(message_types.VoidMessage, StringMessage,
+                      path='profile/calendar', http_method='GET',
+                      name='getCalendarFeed')
+    @instrumented
+    def getCalendarFeed(self, request):
+        """Return the path of the user's iCalendar feed."""
+        prof = self._getProfileFromUser()
+        if not prof.calendarToken:
+            prof.calendarToken = icalfeed.newToken()
+            prof.put()
+        return StringMessage(data=icalfeed.feedPath(prof.calendarToken))
 
-# - - - Announcements - - - - - - - - - - - - - - - - - - - -
+    @endpoints.method(message_types.VoidMessage, StringMessage,
+                      path='profile/calendar', http_method='POST',
+                      name='resetCalendarFeed')
+    @instrumented
+    def resetCalendarFeed(self, request):
+        """Replace the user's iCalendar feed url with a new one."""
+        prof = self._getProfileFromUser()
+        old_token = prof.calendarToken
+        prof.calendarToken = icalfeed.newToken()
+        prof.put()
+        if old_token:
+            memcache.delete(MEMCACHE_CALENDAR_TPL % old_token)
+        return StringMessage(data=icalfeed.feedPath(prof.calendarToken))
 
-    @staticmethod
-    def _cacheAnnouncement():
-        """Create Announcement & assign to memcache; used by
-        memcache cron job & putAnnouncement().
-        """
-        confs = Conference.query(ndb.AND(
-            Conference.seatsAvailable <= 5,
-            Conference.seatsAvailable > 0)
-        ).fetch(projection=[Conference.name])
-
-        if confs:
-            # If there are almost sold out conferences,
-            # format announcement and set it in memcache
-            announcement = ANNOUNCEMENT_TPL % (
-                ', '.join(conf.name for conf in confs))
-            memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
-        else:
-            # If there are no sold out conferences,
-            # delete the memcache announcements entry
-            announcement = ""
-            memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
 
-        return announcement
+# - - - Announcements - - - - - - - - - - - - - - - - - - - -
 
     @endpoints.method(message_types.VoidMessage, StringMessage,
                       path='conference/announcement/get',
                       http_method='GET', name='getAnnouncement')
+    @instrumented
     def getAnnouncement(self, request):
         """Return Announcement from memcache."""
         return StringMessage(
             data=memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY) or "")
 
 
+# - - - Dashboard - - - - - - - - - - - - - - - - - - - - - -
+
+    @endpoints.method(message_types.VoidMessage, DashboardForm,
+                      path='dashboard', http_method='GET',
+                      name='getDashboard')
+    @instrumented
+    @withChangeToken
+    def getDashboard(self, request):
+        """Return profile, attended conferences, wishlist sessions,
+           upcoming conferences, announcement & featured speaker."""
+        prof = self._getProfileFromUser()
+
+        # issue the memcache & datastore lookups before waiting on any
+        cache_rpc = memcache.Client().get_multi_async([
+            MEMCACHE_ANNOUNCEMENTS_KEY, MEMCACHE_FEATURE_KEY,
+            MEMCACHE_UPCOMING_KEY])
+        conf_futures = ndb.get_multi_async(
+            [ndb.Key(urlsafe=wsck) for wsck in prof.conferenceKeysToAttend])
+        session_futures = ndb.get_multi_async(
+            [ndb.Key(urlsafe=wssk) for wssk in prof.sessionWishlist])
+
+        conferences = [conf for conf in
+                       (future.get_result() for future in conf_futures)
+                       if conf]
+        names = getOrganizerNames(conferences)
+        sessions = [session for session in
+                    (future.get_result() for future in session_futures)
+                    if session]
+        cached = cache_rpc.get_result()
+
+        return DashboardForm(
+            profile=self._copyProfileToForm(prof),
+            conferencesToAttend=[
+                self._copyConferenceToForm(conf,
+                                           names.get(conf.organizerUserId))
+                for conf in conferences],
+            wishlistSessions=[self._copySessionToForm(session)
+                              for session in sessions],
+            upcomingConferences=self._getUpcomingForms(
+                cached.get(MEMCACHE_UPCOMING_KEY)),
+            announcement=cached.get(MEMCACHE_ANNOUNCEMENTS_KEY) or "",
+            featuredSpeaker=cached.get(MEMCACHE_FEATURE_KEY) or "",
+        )
+
+
 # - - - Registration - - - - - - - - - - - - - - - - - - - -
 
-    @ndb.transactional(xg=True)
+    @contention.transactional('websafeConferenceKey', xg=True)
     def _conferenceRegistration(self, request, reg=True):
         """Register or unregister user for selected conference."""
         retval = None
@@ -548,9 +1011,11 @@ class ConferenceApi(remote.Service):
         conf.put()
         return BooleanMessage(data=retval)
 
-    @endpoints.method(message_types.VoidMessage, ConferenceForms,
+    @endpoints.method(COMPACT_LIST_REQUEST, ConferenceForms,
                       path='conferences/attending',
                       http_method='GET', name='getConferencesToAttend')
+    @instrumented
+    @withChangeToken
     def getConferencesToAttend(self, request):
         """Get list of conferences that user has registered for."""
         # get user Profile
@@ -560,25 +1025,20 @@ class ConferenceApi(remote.Service):
         conferences = ndb.get_multi(conf_keys)
 
         # get organizers
-        organisers = [ndb.Key(Profile, conf.organizerUserId)
-                      for conf in conferences]
-        profiles = ndb.get_multi(organisers)
-
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
+        names = getOrganizerNames(conferences)
 
         # return set of ConferenceForm objects per Conference
-        return ConferenceForms(
-            items=[self._copyConferenceToForm(conf,
-                                              names[conf.organizerUserId])
-                   for conf in conferences]
-        )
+        return compact.listResponse(
+            ConferenceForms,
+            [self._copyConferenceToForm(conf, names[conf.organizerUserId])
+             for conf in conferences],
+            request.compact)
 
     @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
                       path='conference/{websafeConferenceKey}',
                       http_method='POST', name='registerForConference')
+    @instrumented
+    @throttled
     def registerForConference(self, request):
         """Register user for selected conference."""
         return self._conferenceRegistration(request)
@@ -586,6 +1046,8 @@ class ConferenceApi(remote.Service):
     @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
                       path='conference/{websafeConferenceKey}',
                       http_method='DELETE', name='unregisterFromConference')
+    @instrumented
+    @throttled
     def unregisterFromConference(self, request):
         """Unregister user for selected conference."""
         return self._conferenceRegistration(request, reg=False)
@@ -593,6 +1055,7 @@ class ConferenceApi(remote.Service):
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
                       path='filterPlayground',
                       http_method='GET', name='filterPlayground')
+    @instrumented
     def filterPlayground(self, request):
         """Filter Playground"""
         q = Conference.query()
@@ -611,10 +1074,12 @@ class ConferenceApi(remote.Service):
 
     # - - - Session objects - - - - - - - - - - - - - - - - -
 
-    @endpoints.method(SessionForm,
+    @endpoints.method(SESSION_CREATE_REQUEST,
                       SessionForm,
                       http_method='POST',
                       name='createSession')
+    @instrumented
+    @idempotent(SessionForm)
     def createSession(self, request):
         """Create new session."""
         return self._createSessionObject(request)
@@ -664,9 +1129,7 @@ class ConferenceApi(remote.Service):
 
         # check that the speaker exists
         if data['speaker']:
-            speaker = Speaker.query(Speaker.name == request.speaker).get()
-
-            if not speaker:
+            if not Speaker.query(Speaker.name == request.speaker).get():
                 raise endpoints.NotFoundException(
                     'No speaker found with name: %s' %
                     request.speaker)
@@ -681,6 +1144,8 @@ class ConferenceApi(remote.Service):
 
         # create session in data store and return request
         Session(**data).put()
+        textsearch.enqueueIndexing(s_key)
+        sessiondays.enqueueUpdate(s_key)
 
         # add websafeSessionKey to the request
         request.websafeSessionKey = s_key.urlsafe()
@@ -702,6 +1167,7 @@ class ConferenceApi(remote.Service):
                       SessionForm,
                       http_method='GET',
                       name='getSession')
+    @instrumented
     def getSession(self, request):
         """Return requested session (by websafeSessionKey)."""
         # get Session object from request; bail if not found
@@ -713,30 +1179,40 @@ class ConferenceApi(remote.Service):
         # return SessionForm
         return self._copySessionToForm(session)
 
-    @endpoints.method(CONF_POST_REQUEST, SessionForms,
+    @endpoints.method(SESSION_LIST_REQUEST, SessionForms,
                       path='getConferenceSessions',
                       http_method='POST',
                       name='getConferenceSessions')
+    @instrumented
+    @withChangeToken
     def getConferenceSessions(self, request):
-        """Return all sessions of the given conference"""
+        """Return all sessions of the given conference
+           (optionally only the requested fields)"""
+        projection = self._getProjection(SessionForm, request.fields,
+                                         SESSION_PROJECTION)
 
         # get the conference
         conf = self._getConf(request.websafeConferenceKey)
 
         # get all sessions of the conference
-        sessions = Session.query(ancestor=conf.key)
-        return SessionForms(items=[self._copySessionToForm(session)
-                            for session in sessions])
+        sessions = Session.query(ancestor=conf.key).fetch(
+            projection=projection)
+        return compact.listResponse(
+            SessionForms,
+            [self._copySessionToForm(session, request.fields)
+             for session in sessions],
+            request.compact)
 
     @endpoints.method(SESSION_POST_REQUEST,
                       SessionForm,
                       http_method='PUT',
                       name='updateSession')
+    @instrumented
     def updateSession(self, request):
         """Update session w/provided fields & return w/updated info."""
         return self._updateSessionObject(request)
 
-    @ndb.transactional()
+    @contention.transactional('websafeSessionKey')
     def _updateSessionObject(self, request):
         # get user id
         user = endpoints.get_current_user()
@@ -744,10 +1220,6 @@ class ConferenceApi(remote.Service):
             raise endpoints.UnauthorizedException('Authorization required')
         user_id = getUserId(user)
 
-        # copy SessionForm/ProtoRPC Message into dict
-        data = {field.name: getattr(request, field.name)
-                for field in request.all_fields()}
-
         # get session by websafeSessionKey
         session = ndb.Key(urlsafe=request.websafeSessionKey).get()
 
@@ -765,36 +1237,44 @@ class ConferenceApi(remote.Service):
                 'Only the owner can update the session.')
 
         # Not getting all the fields, so don't create a new object; just
-        # copy relevant fields from SessionForm to Session object
-        for field in request.all_fields():
-            data = getattr(request, field.name)
-            # only copy fields where we get data
-            if data not in (None, []):
-                # special handling for dates (convert string to Date)
-                if field.name == 'date':
-                    data = datetime.strptime(data, "%Y-%m-%d").date()
-                if field.name == 'startTime':
-                    data = datetime.strptime(data, "%H:%M").time()
-                # write to Session object
-                setattr(session, field.name, data)
-        # update session in data store
-        session.put()
+        # copy the fields we get data for from SessionForm
+        values = formValues(request, session)
+        # special handling for dates (convert string to Date)
+        if 'date' in values:
+            values['date'] = datetime.strptime(
+                values['date'], "%Y-%m-%d").date()
+        if 'startTime' in values:
+            values['startTime'] = datetime.strptime(
+                values['startTime'], "%H:%M").time()
+
+        # update session in data store, if something actually changed
+        old_date = session.date
+        if updateEntity(session, values):
+            session.put()
+            textsearch.enqueueIndexing(session.key)
+            sessiondays.enqueueUpdate(session.key, old_date)
         return self._copySessionToForm(session)
 
-    def _copySessionToForm(self, session):
-        """Copy relevant fields from Session to SessionForm."""
+    @serializer
+    def _copySessionToForm(self, session, fields=None):
+        """Copy relevant fields (all or the given ones) from Session
+           to SessionForm."""
         sf = SessionForm()
-        for field in sf.all_fields():
-            if hasattr(session, field.name):
+        for name in formFieldNames(SessionForm):
+            if fields and name not in fields:
+                continue
+            if hasattr(session, name):
                 # convert Date to date string; just copy others
-                if field.name == "date" or field.name == "startTime":
-                    setattr(sf, field.name, str(getattr(session, field.name)))
+                # missing ones are left out, as in compact lists
+                if name == "date" or name == "startTime":
+                    if getattr(session, name) is not None:
+                        setattr(sf, name, str(getattr(session, name)))
                 else:
-                    setattr(sf, field.name, getattr(session, field.name))
-            elif field.name == "websafeSessionKey":
-                    setattr(sf, field.name, session.key.urlsafe())
-            elif field.name == "websafeConferenceKey":
-                    setattr(sf, field.name, session.key.parent().urlsafe())
+                    setattr(sf, name, getattr(session, name))
+            elif name == "websafeSessionKey":
+                    setattr(sf, name, session.key.urlsafe())
+            elif name == "websafeConferenceKey":
+                    setattr(sf, name, session.key.parent().urlsafe())
         sf.check_initialized()
         return sf
 
@@ -802,26 +1282,28 @@ class ConferenceApi(remote.Service):
                       SessionForms,
                       http_method='GET',
                       name='getConferenceSessionsByType')
+    @instrumented
     def getConferenceSessionsByType(self, request):
         """ Get all sessions of the conference of the given type"""
         # get the conference
         conf = self._getConf(request.websafeConferenceKey)
 
         # get all sessions of the conference with the given type
-        sessions = Session.query(
+        sessions = self._fetchEntities(Session.query(
                               Session.type == request.typeOfSession,
-                              ancestor=conf.key).fetch()
+                              ancestor=conf.key))
 
         # return set of SessionForm objects per Session
-        return SessionForms(
-            items=[self._copySessionToForm(session)
-                   for session in sessions]
-        )
+        return compact.listResponse(
+            SessionForms,
+            [self._copySessionToForm(session) for session in sessions],
+            request.compact)
 
-    @endpoints.method(SPEAKER_GET_REQUEST,
+    @endpoints.method(SPEAKER_SESSIONS_REQUEST,
                       SessionForms,
                       http_method='GET',
                       name='getSessionsBySpeaker')
+    @instrumented
     def getSessionsBySpeaker(self, request):
         """Get all sessions given by the speaker across all conferences"""
         # get the speaker
@@ -833,18 +1315,21 @@ class ConferenceApi(remote.Service):
                     request.speakerName)
 
         # get the sessions of this speaker
-        sessions = Session.query(Session.speaker == speaker.name).fetch()
+        sessions = self._fetchEntities(
+            Session.query(Session.speaker == speaker.name))
 
         # return set of SessionForm objects per Session
-        return SessionForms(
-            items=[self._copySessionToForm(session)
-                   for session in sessions]
-        )
+        return compact.listResponse(
+            SessionForms,
+            [self._copySessionToForm(session) for session in sessions],
+            request.compact)
 
-    @endpoints.method(SpeakerForm,
+    @endpoints.method(SPEAKER_CREATE_REQUEST,
                       SpeakerForm,
                       http_method='POST',
                       name='createSpeaker')
+    @instrumented
+    @idempotent(SpeakerForm)
     def createSpeaker(self, request):
         """Create new speaker."""
         return self._createSpeakerObject(request)
@@ -870,6 +1355,7 @@ class ConferenceApi(remote.Service):
                       SpeakerForm,
                       http_method='GET',
                       name='getSpeaker')
+    @instrumented
     def getSpeaker(self, request):
         """Return requested speaker (by speaker name)."""
         # get Speaker object from request; bail if not found
@@ -882,12 +1368,13 @@ class ConferenceApi(remote.Service):
         # return SpeakerForm
         return self._copySpeakerToForm(speaker)
 
+    @serializer
     def _copySpeakerToForm(self, speaker):
         """Copy relevant fields from Speaker to SpeakerForm."""
         sf = SpeakerForm()
-        for field in sf.all_fields():
-            if hasattr(speaker, field.name):
-                    setattr(sf, field.name, getattr(speaker, field.name))
+        for name in formFieldNames(SpeakerForm):
+            if hasattr(speaker, name):
+                    setattr(sf, name, getattr(speaker, name))
         sf.check_initialized()
         return sf
 
@@ -895,6 +1382,8 @@ class ConferenceApi(remote.Service):
                       BooleanMessage,
                       http_method='POST',
                       name='addSessionToWishlist')
+    @instrumented
+    @throttled
     def addSessionToWishlist(self, request):
         """Adds the given session to the wishlist of the user"""
         # get profile
@@ -910,10 +1399,12 @@ class ConferenceApi(remote.Service):
 
         return BooleanMessage(data=True)
 
-    @endpoints.method(message_types.VoidMessage,
+    @endpoints.method(COMPACT_LIST_REQUEST,
                       SessionForms,
                       http_method='GET',
                       name='getAllSessionsInWishlist')
+    @instrumented
+    @withChangeToken
     def getAllSessionsInWishlist(self, request):
         """Returns all sessions in the user's wishlist"""
         # get profile
@@ -923,14 +1414,65 @@ class ConferenceApi(remote.Service):
         sessions = ndb.get_multi(session_keys)
 
         # return set of Session Form objects per Session
-        return SessionForms(
-            items=[self._copySessionToForm(session)
-                   for session in sessions])
+        return compact.listResponse(
+            SessionForms,
+            [self._copySessionToForm(session) for session in sessions],
+            request.compact)
+
+    def _copyConflictsToForms(self, conflicts):
+        """Copy schedule conflict triples to SessionConflictForms."""
+        forms = {}
+
+        def sessionForm(session):
+            if session.key not in forms:
+                forms[session.key] = self._copySessionToForm(session)
+            return forms[session.key]
+
+        return SessionConflictForms(items=[
+            SessionConflictForm(
+                sessions=[sessionForm(first), sessionForm(second)],
+                overlapMinutes=int(overlap.total_seconds() // 60))
+            for first, second, overlap in conflicts])
+
+    @endpoints.method(message_types.VoidMessage,
+                      SessionConflictForms,
+                      http_method='GET',
+                      name='getWishlistConflicts')
+    @instrumented
+    def getWishlistConflicts(self, request):
+        """Returns every pair of overlapping sessions in the wishlist"""
+        prof = self._getProfileFromUser()
+        sessions = ndb.get_multi([ndb.Key(urlsafe=swl)
+                                  for swl in prof.sessionWishlist])
+        return self._copyConflictsToForms(schedule.findConflicts(
+            [session for session in sessions if session]))
+
+    @endpoints.method(SESSION_GET_REQUEST,
+                      SessionConflictForms,
+                      http_method='GET',
+                      name='checkWishlistConflicts')
+    @instrumented
+    def checkWishlistConflicts(self, request):
+        """Returns the wishlist sessions the given session overlaps with,
+           to check before adding it to the wishlist"""
+        prof = self._getProfileFromUser()
+        session_key = ndb.Key(urlsafe=request.websafeSessionKey)
+        entities = ndb.get_multi(
+            [session_key] + [ndb.Key(urlsafe=swl)
+                             for swl in prof.sessionWishlist])
+        session = entities[0]
+        if not session:
+            raise endpoints.NotFoundException(
+                'No session found with key: %s' %
+                request.websafeSessionKey)
+        return self._copyConflictsToForms(schedule.conflictsWith(
+            session, [other for other in entities[1:] if other]))
 
     @endpoints.method(CONF_GET_REQUEST,
                       SessionForms,
                       http_method='GET',
                       name='getSessionsInWishlist')
+    @instrumented
     def getSessionsInWishlist(self, request):
         """Returns all sessions of the conference in the user's wishlist"""
         # get Conference object from request; bail if not found
@@ -952,10 +1494,70 @@ class ConferenceApi(remote.Service):
         return SessionForms(
             items=[self._copySessionToForm(session) for session in sessions])
 
+    @endpoints.method(SESSION_QUERY_REQUEST,
+                      SessionForms,
+                      http_method='GET',
+                      name='querySessions')
+    @instrumented
+    def querySessions(self, request):
+        """Returns the sessions of the conference matching all given
+           predicates (date, time & duration ranges, types to include or
+           exclude, speaker), a page at a time"""
+        conf = self._getConf(request.websafeConferenceKey)
+        if not 0 < request.limit <= MAX_PAGE_SIZE:
+            raise endpoints.BadRequestException(
+                'limit must be between 1 and %d.' % MAX_PAGE_SIZE)
+        try:
+            cursor = ndb.Cursor(urlsafe=request.pageToken)
+        except datastore_errors.BadValueError:
+            raise endpoints.BadRequestException('Invalid pageToken.')
+
+        criteria = sessionquery.Criteria(
+            fromDate=self._parseDate(request.fromDate, 'fromDate'),
+            toDate=self._parseDate(request.toDate, 'toDate'),
+            fromTime=self._parseTime(request.fromTime, 'fromTime'),
+            toTime=self._parseTime(request.toTime, 'toTime'),
+            minDuration=request.minDuration,
+            maxDuration=request.maxDuration,
+            includeTypes=request.includeTypes,
+            excludeTypes=request.excludeTypes,
+            speaker=request.speaker)
+        query = sessionquery.plan(conf.key, criteria)
+        sessions, next_cursor = sessionquery.fetchPage(
+            query, criteria, request.limit, cursor)
+        return compact.listResponse(
+            SessionForms,
+            [self._copySessionToForm(session) for session in sessions],
+            request.compact,
+            nextPageToken=next_cursor.urlsafe() if next_cursor else None)
+
+    @endpoints.method(SESSIONS_HAPPENING_REQUEST,
+                      SessionForms,
+                      path='sessions/happening',
+                      http_method='GET',
+                      name='getSessionsHappening')
+    @instrumented
+    def getSessionsHappening(self, request):
+        """Returns the sessions of all conferences on the date (default
+           today) running between fromTime and toTime (both optional),
+           ordered by start time"""
+        day = self._parseDate(request.date, 'date') or date.today()
+        websafe_keys = sessiondays.sessionsHappening(
+            day, self._parseTime(request.fromTime, 'fromTime'),
+            self._parseTime(request.toTime, 'toTime'))
+        sessions = ndb.get_multi([ndb.Key(urlsafe=websafe_key)
+                                  for websafe_key in websafe_keys])
+        return compact.listResponse(
+            SessionForms,
+            [self._copySessionToForm(session)
+             for session in sessions if session],
+            request.compact)
+
     @endpoints.method(SESSION_TIME_EXCLTYPES_GET_REQUEST,
                       SessionForms,
                       http_method='GET',
                       name='getSessionsOfConferenceBeforeStartTimeExclTypes')
+    @instrumented
     def getSessionsOfConferenceBeforeStartTimeExclTypes(self, request):
         """Returns all sessions of the conference
            before the start time excluding the types"""
@@ -981,6 +1583,7 @@ class ConferenceApi(remote.Service):
                       SessionForms,
                       http_method='GET',
                       name='getNonWSSessionsOfConfBefore7pm')
+    @instrumented
     def getNonWSSessionsOfConfBefore7pm(self, request):
         """Returns all sessions of the conference
            before the 7pm excluding workshops"""
@@ -1006,6 +1609,7 @@ class ConferenceApi(remote.Service):
                       SessionForms,
                       http_method='GET',
                       name='getSessionsOfConferenceToday')
+    @instrumented
     def getSessionsOfConferenceToday(self, request):
         """Returns all sessios of today of the conference"""
         conf = self._getConf(request.websafeConferenceKey)
@@ -1020,6 +1624,7 @@ class ConferenceApi(remote.Service):
                       StringMessage,
                       http_method='GET',
                       name='getHighlightsOfConference')
+    @instrumented
     def getHighlightsOfConference(self, request):
         """Returns the highlights of all sessions of the conference"""
         conf = self._getConf(request.websafeConferenceKey)
@@ -1035,17 +1640,58 @@ class ConferenceApi(remote.Service):
     @endpoints.method(message_types.VoidMessage,
                       StringMessage,
                       http_method='GET', name='getFeaturedSpeaker')
+    @instrumented
     def getFeaturedSpeaker(self, request):
         """Return Featured Speaker from memcache."""
         featured_speaker = memcache.get(MEMCACHE_FEATURE_KEY)
         return StringMessage(data=featured_speaker or "")
 
-    @staticmethod
-    def _cacheFeaturedSpeaker(speaker, sessions):
-        """Create Featured Speaker & assign to memcache"""
-        featured_speaker = FEATURED_SPEAKER_TPL % (speaker, sessions)
-        memcache.set(MEMCACHE_FEATURE_KEY, featured_speaker)
-        return sessions
+# - - - Search - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def _getPage(self, request):
+        """Return (offset, limit) from the request's paging fields."""
+        try:
+            offset = int(request.pageToken or 0)
+        except ValueError:
+            raise endpoints.BadRequestException('Invalid pageToken.')
+        if offset < 0 or not 0 < request.limit <= MAX_PAGE_SIZE:
+            raise endpoints.BadRequestException(
+                'limit must be between 1 and %d.' % MAX_PAGE_SIZE)
+        return offset, request.limit
+
+    def _searchEntities(self, kind, request):
+        """Return (entities, nextPageToken) of a search request."""
+        offset, limit = self._getPage(request)
+        keys, more = textsearch.search(kind, request.query, offset, limit)
+        entities = [entity for entity in
+                    ndb.get_multi([ndb.Key(urlsafe=k) for k in keys])
+                    if entity]
+        return entities, str(offset + limit) if more else None
+
+    @endpoints.method(SEARCH_REQUEST, ConferenceForms,
+                      path='searchConferences',
+                      http_method='GET', name='searchConferences')
+    @instrumented
+    def searchConferences(self, request):
+        """Search conference names, descriptions & topics, best first."""
+        conferences, next_page = self._searchEntities('Conference', request)
+        names = getOrganizerNames(conferences)
+        return ConferenceForms(
+            items=[self._copyConferenceToForm(
+                       conf, names.get(conf.organizerUserId))
+                   for conf in conferences],
+            nextPageToken=next_page)
+
+    @endpoints.method(SEARCH_REQUEST, SessionForms,
+                      path='searchSessions',
+                      http_method='GET', name='searchSessions')
+    @instrumented
+    def searchSessions(self, request):
+        """Search session names, highlights & speakers, best first."""
+        sessions, next_page = self._searchEntities('Session', request)
+        return SessionForms(
+            items=[self._copySessionToForm(session) for session in sessions],
+            nextPageToken=next_page)
 
 # register API
 api = endpoints.api_server([ConferenceApi])
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+"""contention.py
+
+Transaction retries with jittered exponential backoff, and contention
+telemetry.
+
+`transactional` replaces ndb.transactional on the API's write paths. Every
+attempt runs as a single-try ndb transaction; when the commit collides
+with a concurrent one, the attempt is counted and retried after a random
+delay of up to BASE_DELAY * 2^attempt seconds, capped at MAX_DELAY.
+Attempts, collisions, retries, commits and commit latency are kept as memcache
+counters per transaction and per entity group (the conference or session
+a request names). The groups that collided most are kept in the HOTSPOTS
+list read by the admin contention handler in main.py.
+
+"""
+
+import functools
+import random
+import time
+from collections import defaultdict
+
+from google.appengine.api import datastore_errors
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from utils import casUpdate
+
+MEMCACHE_NAMESPACE = 'contention'
+MEMCACHE_INDEX_KEY = 'TRANSACTIONS'
+MEMCACHE_HOTSPOTS_KEY = 'HOTSPOTS'
+MAX_HOTSPOTS = 50
+
+RETRIES = 5
+BASE_DELAY = 0.02
+MAX_DELAY = 1.0
+
+COUNTERS = ('attempts', 'collisions', 'retries', 'commits', 'commit_us')
+
+_published = set()
+
+
+def transactional(request_field, retries=RETRIES, xg=False):
+    """Run the (self, request, ...) method in a transaction, retrying
+       collisions with backoff; request_field names the request field
+       identifying the contended entity group."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if ndb.in_transaction():
+                return func(*args, **kwargs)
+            name = func.__name__
+            group = getattr(args[1], request_field, None)
+            counters = defaultdict(int)
+            try:
+                for attempt in range(retries + 1):
+                    counters['attempts'] += 1
+                    start = time.time()
+                    try:
+                        result = ndb.transaction(
+                            lambda: func(*args, **kwargs),
+                            retries=0, xg=xg)
+                    except datastore_errors.TransactionFailedError:
+                        counters['collisions'] += 1
+                        if attempt == retries:
+                            raise
+                        counters['retries'] += 1
+                        time.sleep(random.uniform(
+                            0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt)))
+                        continue
+                    counters['commits'] += 1
+                    counters['commit_us'] += int((time.time() - start) * 1e6)
+                    return result
+            finally:
+                record(name, group, counters)
+        return wrapper
+    return decorator
+
+
+def record(name, group, counters):
+    """Add the counters of one transaction to the memcache aggregates."""
+    offsets = {}
+    for counter, value in counters.items():
+        offsets['%s:%s' % (name, counter)] = value
+        if group and counter in ('attempts', 'collisions'):
+            offsets['%s:%s:%s' % (name, group, counter)] = value
+    memcache.offset_multi(offsets, namespace=MEMCACHE_NAMESPACE,
+                          initial_value=0)
+    _publish(name)
+    if group and counters['collisions']:
+        _addHotspot('%s:%s' % (name, group), counters['collisions'])
+
+
+def _publish(name):
+    """Add the transaction name to the index of known transactions."""
+    if name in _published:
+        return
+    if casUpdate(MEMCACHE_INDEX_KEY,
+                 lambda names: sorted(set(names or []) | set([name])),
+                 MEMCACHE_NAMESPACE):
+        _published.add(name)
+
+
+def _addHotspot(label, collisions):
+    """Add collisions to the label in the list of the most contended
+       groups, keeping the MAX_HOTSPOTS top ones."""
+    def update(hotspots):
+        hotspots = dict(hotspots or {})
+        hotspots[label] = hotspots.get(label, 0) + collisions
+        top = sorted(hotspots.items(), key=lambda item: -item[1])
+        return dict(top[:MAX_HOTSPOTS])
+    casUpdate(MEMCACHE_HOTSPOTS_KEY, update, MEMCACHE_NAMESPACE)
+
+
+def getReport(top=20):
+    """Return the per-transaction totals & the most contended groups."""
+    names = memcache.get(MEMCACHE_INDEX_KEY,
+                         namespace=MEMCACHE_NAMESPACE) or []
+    hotspots = memcache.get(MEMCACHE_HOTSPOTS_KEY,
+                            namespace=MEMCACHE_NAMESPACE) or {}
+    labels = sorted(hotspots, key=lambda label: -hotspots[label])[:top]
+    values = memcache.get_multi(
+        ['%s:%s' % (name, counter) for name in names
+         for counter in COUNTERS] +
+        ['%s:attempts' % label for label in labels],
+        namespace=MEMCACHE_NAMESPACE)
+
+    def value(key):
+        return int(values.get(key) or 0)
+
+    transactions = []
+    for name in names:
+        totals = dict((counter, value('%s:%s' % (name, counter)))
+                      for counter in COUNTERS)
+        if not totals['attempts']:
+            continue
+        transactions.append({
+            'transaction': name,
+            'totals': totals,
+            'collisionRate': float(totals['collisions']) / totals['attempts'],
+            'avgCommitMs': (totals['commit_us'] / 1000.0 / totals['commits']
+                            if totals['commits'] else None),
+        })
+    transactions.sort(key=lambda t: t['totals']['collisions'], reverse=True)
+
+    return {
+        'transactions': transactions,
+        'hotspots': [{
+            'transaction': label.split(':', 1)[0],
+            'group': label.split(':', 1)[1],
+            'collisions': hotspots[label],
+            'attempts': value('%s:attempts' % label),
+        } for label in labels],
+    }
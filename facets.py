@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+
+"""facets.py
+
+Precomputed facet counts for the conference filter UI.
+
+A FacetCount entity per scope holds the number of conferences per city,
+topic, start month and attendee bucket. The scopes are the live and the
+archived conferences, and within each the conferences matching an
+equality filter on a city, topic or month, so the counts combined with
+such a filter are served from the counters too. Creating or updating a
+conference enqueues /tasks/update_facets with the changed (scope, facet,
+value) cells; the counts are cached in memcache per scope.
+
+Each scope is updated in its own transaction, which also records the
+name of the task; a retried task skips the scopes it already updated.
+The names of the last APPLIED_TASKS tasks are kept per scope.
+
+The facet_recount migration rebuilds the counters into a new generation
+while the current one keeps serving and being updated, and switches to
+it when done. Conferences are counted into the new generation once,
+either by the recount or by their first change during the recount: the
+one that comes first puts a FacetRecountMark in the conference's entity
+group, so a change sends its deltas to the new counters only if the
+conference was counted before it.
+
+"""
+
+import json
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import FacetCount
+from models import FacetRecountMark
+from models import FacetState
+from utils import deleteAll
+
+MEMCACHE_FACETS_TPL = 'FACET_COUNTS:%s'
+# bounds how long a read racing with an update can keep stale counts
+FACETS_CACHE_TIMEOUT = 600
+
+# facet name as used by the query filters (see conference.FIELDS)
+FACETS = ('CITY', 'TOPIC', 'MONTH', 'MAX_ATTENDEES')
+# facets whose equality filter has its own counters
+FILTER_FACETS = ('CITY', 'TOPIC', 'MONTH')
+
+# (lower bound, label) of the maxAttendees buckets, highest first
+ATTENDEE_BUCKETS = ((1000, '1000+'), (500, '500-999'), (100, '100-499'),
+                    (1, '1-99'), (0, 'unlimited'))
+
+APPLIED_TASKS = 200
+
+STATE_ID = 'facets'
+
+
+def attendeeBucket(max_attendees):
+    for lower, label in ATTENDEE_BUCKETS:
+        if (max_attendees or 0) >= lower:
+            return label
+
+
+def scope(archived, facet=None, value=None):
+    """Return the id of the counters of the live (or archived)
+    conferences, with facet == value if given."""
+    name = 'archived' if archived else 'live'
+    if facet:
+        name = '%s|%s:%s' % (name, facet, value)
+    return name
+
+
+def facetValues(conf):
+    """Return the set of (facet, value) pairs of the conference."""
+    values = set()
+    if conf.city:
+        values.add(('CITY', conf.city))
+    for topic in conf.topics:
+        values.add(('TOPIC', topic))
+    if conf.month:
+        values.add(('MONTH', str(conf.month)))
+    values.add(('MAX_ATTENDEES', attendeeBucket(conf.maxAttendees)))
+    return values
+
+
+def counterCells(conf):
+    """Return the set of (scope, facet, value) counters the conference
+    counts in."""
+    values = facetValues(conf)
+    scopes = [scope(conf.archived)] + [
+        scope(conf.archived, facet, value)
+        for facet, value in values if facet in FILTER_FACETS]
+    return set((name, facet, value)
+               for name in scopes for facet, value in values)
+
+
+def counterId(generation, name):
+    """Return the FacetCount id of the scope in a generation."""
+    if not generation:
+        # the counters from before there were generations
+        return name
+    return '%d/%s' % (generation, name)
+
+
+def _loadState():
+    return (FacetState.get_by_id(STATE_ID, use_cache=False) or
+            FacetState(id=STATE_ID))
+
+
+@ndb.non_transactional
+def getState():
+    """Return the FacetState, also from within a conference's
+    transaction."""
+    return _loadState()
+
+
+def _deltas(generation, old_cells, new_cells):
+    return ([(counterId(generation, name), facet, value, -1)
+             for name, facet, value in old_cells - new_cells] +
+            [(counterId(generation, name), facet, value, 1)
+             for name, facet, value in new_cells - old_cells])
+
+
+@ndb.transactional
+def _markCounted(conf_key, generation):
+    """Mark the conference counted into the generation; return False if
+    it was already."""
+    key = ndb.Key(FacetRecountMark, generation, parent=conf_key)
+    if key.get() is not None:
+        return False
+    FacetRecountMark(key=key, generation=generation).put()
+    return True
+
+
+def enqueueUpdate(conf_key, old_cells, new_cells):
+    """Enqueue the count changes between two counterCells() results of
+    the conference, within the running transaction if there is one; it
+    should run in one that also writes the conference."""
+    state = getState()
+    deltas = _deltas(state.current, old_cells, new_cells)
+    if state.building:
+        if _markCounted(conf_key, state.building):
+            # not counted by the recount yet: count it as it is now
+            old_cells = set()
+        deltas += _deltas(state.building, old_cells, new_cells)
+    if deltas:
+        taskqueue.add(url='/tasks/update_facets',
+                      params={'deltas': json.dumps(deltas)},
+                      transactional=ndb.in_transaction())
+
+
+@ndb.transactional_tasklet
+def _updateScope(name, deltas, task):
+    key = ndb.Key(FacetCount, name)
+    counter = yield key.get_async()
+    if counter is None:
+        counter = FacetCount(key=key, counts={})
+    elif task and task in counter.tasks:
+        return
+    for facet, value, delta in deltas:
+        values = counter.counts.setdefault(facet, {})
+        # counts may go below zero for a while: the update tasks of a
+        # conference can run out of order
+        values[value] = values.get(value, 0) + delta
+        if not values[value]:
+            del values[value]
+    if task:
+        counter.tasks = (counter.tasks + [task])[-APPLIED_TASKS:]
+    yield counter.put_async()
+
+
+def applyDeltas(deltas, task=None):
+    """Apply [(scope, facet, value, delta), ...]; used by the update
+    task, named `task` for retries to be skipped."""
+    scopes = {}
+    for name, facet, value, delta in deltas:
+        scopes.setdefault(name, []).append((facet, value, delta))
+    futures = [_updateScope(name, scope_deltas, task)
+               for name, scope_deltas in scopes.items()]
+    ndb.Future.wait_all(futures)
+    for future in futures:
+        future.check_success()
+    memcache.delete_multi([MEMCACHE_FACETS_TPL % name for name in scopes])
+
+
+def getCounts(name):
+    """Return {facet: {value: count}} of the conferences in the scope."""
+    counter_id = counterId(getState().current, name)
+    key = MEMCACHE_FACETS_TPL % counter_id
+    counts = memcache.get(key)
+    if counts is None:
+        counts = dict((facet, {}) for facet in FACETS)
+        counter = FacetCount.get_by_id(counter_id)
+        if counter is not None:
+            for facet, values in counter.counts.items():
+                counts[facet] = dict((value, count)
+                                     for value, count in values.items()
+                                     if count > 0)
+        # add: don't replace counts cached meanwhile by a newer read
+        memcache.add(key, counts, time=FACETS_CACHE_TIMEOUT)
+    return counts
+
+
+@ndb.transactional
+def startRecount():
+    """Start building a new generation of counters; used when the
+    facet_recount migration starts. A recount still running is
+    abandoned."""
+    state = _loadState()
+    state.building = (state.building or state.current) + 1
+    state.put()
+
+
+@ndb.transactional
+def _countOnce(conf_key, generation, batch):
+    """Mark the conference counted by the recount batch; return the
+    cells the batch counts it in (none if a change counted it)."""
+    key = ndb.Key(FacetRecountMark, generation, parent=conf_key)
+    mark = key.get()
+    if mark is None:
+        conf = conf_key.get()
+        if conf is None:
+            return set()
+        mark = FacetRecountMark(key=key, generation=generation,
+                                batch=batch,
+                                cells=sorted(counterCells(conf)))
+        mark.put()
+    elif mark.batch != batch:
+        return set()
+    # JSON turns the tuples into lists
+    return set(tuple(cell) for cell in mark.cells)
+
+
+def addConferences(conferences):
+    """Count the conferences into the counters being built; used by the
+    facet_recount migration. Named after the generation and the first
+    conference, so that a retried batch is counted once."""
+    generation = getState().building
+    if not conferences or not generation:
+        return
+    batch = 'facet_recount:%d:%s' % (generation,
+                                     conferences[0].key.urlsafe())
+    deltas = []
+    for conf in conferences:
+        deltas += _deltas(generation, set(),
+                          _countOnce(conf.key, generation, batch))
+    applyDeltas(deltas, batch)
+
+
+def finishRecount():
+    """Switch to the counters the recount built and delete the others
+    with the recount marks; used when the facet_recount migration is
+    done."""
+    state = _switchGeneration()
+    prefix = counterId(state.current, '')
+    keys = FacetCount.query().fetch(keys_only=True)
+    ndb.delete_multi([key for key in keys
+                      if not key.id().startswith(prefix)])
+    deleteAll(FacetRecountMark.query(
+        FacetRecountMark.generation <= state.current))
+
+
+@ndb.transactional
+def _switchGeneration():
+    state = _loadState()
+    if state.building:
+        state.current, state.building = state.building, None
+        state.put()
+    return state
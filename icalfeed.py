@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+"""icalfeed.py
+
+iCalendar feeds of the conferences a user attends and the sessions in
+their wishlist, for calendar apps.
+
+A profile gets a random feed token on request (getCalendarFeed); the feed
+is served without sign in at /calendar/<token>.ics by main.py. Calendar
+apps poll feeds often, so the rendered feed is cached in memcache along
+with the version of the user's schedule it was rendered at: until the
+profile or one of its conferences & sessions is put, a poll
+costs the profile and a batch get of these, both served from ndb's
+memcache, instead of a query and a render. The ETag is a hash of the
+feed, so a re-render that changes nothing still answers If-None-Match
+with a 304.
+
+"""
+
+import binascii
+import hashlib
+import os
+from datetime import datetime
+from datetime import timedelta
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from models import MEMCACHE_CALENDAR_TPL
+from models import Profile
+
+FEED_PATH = '/calendar/%s.ics'
+# drops the feeds no calendar app polls anymore
+FEED_TIMEOUT = 6 * 3600
+# how long calendar apps may use a feed without revalidating it
+MAX_AGE = 900
+
+PRODID = '-//Conference Central//Schedule//EN'
+UID_DOMAIN = 'conference-central'
+
+
+def newToken():
+    return binascii.hexlify(os.urandom(16))
+
+
+def feedPath(token):
+    return FEED_PATH % token
+
+
+def _scheduleVersion(profile):
+    """Return '<profile version>.<hash>' of the versions of the profile
+    and the conferences & sessions it refers to."""
+    keys = [ndb.Key(urlsafe=key) for key in
+            profile.conferenceKeysToAttend + profile.sessionWishlist]
+    versions = [entity.version if entity else 0
+                for entity in ndb.get_multi(keys)]
+    digest = hashlib.md5(','.join(str(version) for version in versions))
+    return '%d.%s' % (profile.version, digest.hexdigest()[:12])
+
+
+def getFeed(token):
+    """Return (etag, text) of the feed, or None for an unknown token."""
+    key = MEMCACHE_CALENDAR_TPL % token
+    entry = memcache.get(key)
+    if entry:
+        profile_key, version, etag, text = entry
+        profile = profile_key.get()
+        if (profile is not None and profile.calendarToken == token and
+                _scheduleVersion(profile) == version):
+            return etag, text
+
+    profile = Profile.query(Profile.calendarToken == token).get()
+    if profile is None:
+        return None
+    version = _scheduleVersion(profile)
+    text = render(profile)
+    etag = hashlib.md5(text).hexdigest()
+    memcache.set(key, (profile.key, version, etag, text),
+                 time=FEED_TIMEOUT)
+    return etag, text
+
+
+# - - - Rendering - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _escape(text):
+    return (text.replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\n', '\\n'))
+
+
+def _fold(line):
+    """Split a content line into lines of at most 75 octets."""
+    encoded = line.encode('utf-8')
+    parts = []
+    while len(encoded) > 75:
+        cut = 75 if not parts else 74
+        # don't split a multi-byte character
+        while cut and (ord(encoded[cut]) & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut])
+        encoded = encoded[cut:]
+    parts.append(encoded)
+    return '\r\n '.join(parts)
+
+
+def _event(key, start, end, summary, location=None, description=None):
+    """Return the lines of a VEVENT; start & end are dates (all day
+       events, end exclusive) or floating datetimes."""
+    if isinstance(start, datetime):
+        value, fmt = '', '%Y%m%dT%H%M%S'
+    else:
+        value, fmt = ';VALUE=DATE', '%Y%m%d'
+    lines = [
+        'BEGIN:VEVENT',
+        'UID:%s@%s' % (key.urlsafe(), UID_DOMAIN),
+        # derived from the event, so that rendering is repeatable
+        'DTSTAMP:%sZ' % start.strftime('%Y%m%dT%H%M%S'),
+        'DTSTART%s:%s' % (value, start.strftime(fmt)),
+    ]
+    if end:
+        lines.append('DTEND%s:%s' % (value, end.strftime(fmt)))
+    lines.append('SUMMARY:' + _escape(summary))
+    if location:
+        lines.append('LOCATION:' + _escape(location))
+    if description:
+        lines.append('DESCRIPTION:' + _escape(description))
+    lines.append('END:VEVENT')
+    return lines
+
+
+def _conferenceEvent(conf):
+    end = (conf.endDate or conf.startDate) + timedelta(days=1)
+    return _event(conf.key, conf.startDate, end, conf.name, conf.city,
+                  conf.description)
+
+
+def _sessionEvent(session, conf):
+    if session.startTime:
+        start = datetime.combine(session.date, session.startTime)
+        end = (start + timedelta(minutes=session.duration)
+               if session.duration else None)
+    else:
+        start, end = session.date, session.date + timedelta(days=1)
+    description = ', '.join(filter(None, [
+        session.speaker, session.type, conf and conf.name]))
+    return _event(session.key, start, end, session.name,
+                  conf and conf.city, description)
+
+
+def render(profile):
+    """Return the iCalendar text of the profile's schedule."""
+    conf_keys = [ndb.Key(urlsafe=wsck)
+                 for wsck in profile.conferenceKeysToAttend]
+    session_keys = [ndb.Key(urlsafe=wssk)
+                    for wssk in profile.sessionWishlist]
+    entities = ndb.get_multi(conf_keys + session_keys)
+    confs = [conf for conf in entities[:len(conf_keys)]
+             if conf and conf.startDate]
+    sessions = [session for session in entities[len(conf_keys):]
+                if session and session.date]
+    # sessions are children of their conference
+    parent_keys = list(set(session.key.parent() for session in sessions))
+    parents = dict(zip(parent_keys, ndb.get_multi(parent_keys)))
+
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:' + PRODID,
+        'CALSCALE:GREGORIAN',
+        'X-WR-CALNAME:' + _escape(
+            'Conference Central - %s' % (profile.displayName or 'schedule')),
+    ]
+    for conf in sorted(confs, key=lambda conf: conf.startDate):
+        lines.extend(_conferenceEvent(conf))
+    for session in sorted(sessions, key=lambda session: (
+            session.date, session.startTime)):
+        lines.extend(_sessionEvent(session,
+                                   parents.get(session.key.parent())))
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(_fold(line) for line in lines) + '\r\n'
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+"""idempotency.py
+
+Replay protection for the create endpoints.
+
+A client may send an idempotencyKey with a create request and reuse it
+when retrying. The first response is stored in memcache and in an
+IdempotentResult entity for RETENTION; a retry with the same key gets
+that response back without creating anything. While the first request is
+still running, its key is claimed in memcache so that a concurrent retry
+is rejected instead of creating a duplicate.
+
+"""
+
+from datetime import datetime
+from datetime import timedelta
+
+from protorpc import protojson
+
+from google.appengine.api import memcache
+
+from models import IdempotentResult
+from utils import deleteAll
+
+MEMCACHE_NAMESPACE = 'idempotency'
+RETENTION = timedelta(hours=24)
+# how long a running request holds its key
+CLAIM_TIMEOUT = 60
+PENDING = '__pending__'
+
+
+def scope(method, user_id, key):
+    """Return the id results of this method, user & key are stored by."""
+    return '%s:%s:%s' % (method, user_id, key)
+
+
+def getResult(result_id, message_cls):
+    """Return the stored response (a message_cls) or None."""
+    cached = memcache.get(result_id, namespace=MEMCACHE_NAMESPACE)
+    if cached == PENDING:
+        return None
+    if cached is None:
+        result = IdempotentResult.get_by_id(result_id)
+        if result is None or result.created < datetime.now() - RETENTION:
+            return None
+        cached = result.response
+        memcache.set(result_id, cached, time=_remaining(result.created),
+                     namespace=MEMCACHE_NAMESPACE)
+    return protojson.decode_message(message_cls, cached)
+
+
+def claim(result_id):
+    """Claim the key for a running request; False if already claimed
+       (or already answered)."""
+    return memcache.add(result_id, PENDING, time=CLAIM_TIMEOUT,
+                        namespace=MEMCACHE_NAMESPACE)
+
+
+def release(result_id):
+    """Release the claim of a request that failed, so it can be retried."""
+    memcache.delete(result_id, namespace=MEMCACHE_NAMESPACE)
+
+
+def storeResult(result_id, response):
+    encoded = protojson.encode_message(response)
+    IdempotentResult(id=result_id, response=encoded).put()
+    memcache.set(result_id, encoded, time=int(RETENTION.total_seconds()),
+                 namespace=MEMCACHE_NAMESPACE)
+
+
+def purgeExpired():
+    """Delete the results older than RETENTION; used by a daily cron."""
+    return deleteAll(IdempotentResult.query(
+        IdempotentResult.created < datetime.now() - RETENTION))
+
+
+def _remaining(created):
+    return max(1, int((created + RETENTION - datetime.now()).total_seconds()))
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+
+"""instrumentation.py
+
+Per-endpoint cost instrumentation for the Conference API.
+
+`instrumented` wraps an endpoint method and records its wall time, the
+datastore, memcache and task queue RPCs it issues and the time spent in
+the `serializer` decorated `_copy*ToForm` helpers. Totals and a latency
+histogram per endpoint are kept as memcache counters and read back by
+the admin stats handler in main.py.
+
+Calls chosen by the profiling module run under the profiler as well;
+while they do, the RPC hooks also time each RPC into the profile.
+
+Doesn't depend on the Endpoints library so that it can be imported by
+lightweight handlers as well.
+
+"""
+
+import functools
+import threading
+import time
+from collections import defaultdict
+
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import memcache
+
+import profiling
+from utils import casUpdate
+
+MEMCACHE_NAMESPACE = 'stats'
+MEMCACHE_INDEX_KEY = 'ENDPOINTS'
+
+# upper bounds (ms) of the latency histogram buckets
+HISTOGRAM_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# (service, call) -> counter
+RPC_COUNTERS = {
+    ('datastore_v3', 'Get'): 'datastore_gets',
+    ('datastore_v3', 'RunQuery'): 'datastore_queries',
+    ('datastore_v3', 'Next'): 'datastore_nexts',
+    ('datastore_v3', 'Put'): 'datastore_puts',
+    ('datastore_v3', 'Delete'): 'datastore_deletes',
+    ('datastore_v3', 'Commit'): 'datastore_commits',
+    ('taskqueue', 'Add'): 'tasks_enqueued',
+}
+
+COUNTERS = ('datastore_gets', 'datastore_queries', 'datastore_nexts',
+            'datastore_puts', 'datastore_deletes', 'datastore_commits',
+            'memcache_hits', 'memcache_misses', 'tasks_enqueued',
+            'wall_us', 'serialize_us')
+
+_local = threading.local()
+_published = set()
+
+
+class RequestStats(object):
+    """Counters of a single endpoint call."""
+
+    def __init__(self, name):
+        self.name = name
+        self.counters = defaultdict(int)
+        self.start = time.time()
+
+    def finish(self):
+        self.counters['wall_us'] = int((time.time() - self.start) * 1e6)
+        return self
+
+    @property
+    def bucket(self):
+        wall_ms = self.counters['wall_us'] / 1000.0
+        for bound in HISTOGRAM_BUCKETS:
+            if wall_ms <= bound:
+                return 'le_%d' % bound
+        return 'gt_%d' % HISTOGRAM_BUCKETS[-1]
+
+
+def currentStats():
+    """Return the RequestStats of the running endpoint call, if any."""
+    return getattr(_local, 'stats', None)
+
+
+# - - - RPC hooks - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _preCallHook(service, call, request, response):
+    stats = currentStats()
+    if stats is None:
+        return
+    profile = profiling.currentState()
+    if profile is not None:
+        profile.rpcStarted(response)
+    counter = RPC_COUNTERS.get((service, call))
+    if counter:
+        stats.counters[counter] += 1
+    elif service == 'taskqueue' and call == 'BulkAdd':
+        stats.counters['tasks_enqueued'] += request.add_request_size()
+
+
+def _postCallHook(service, call, request, response):
+    stats = currentStats()
+    if stats is None:
+        return
+    profile = profiling.currentState()
+    if profile is not None:
+        profile.rpcFinished(service, call, response)
+    if service != 'memcache' or call != 'Get':
+        return
+    hits = response.item_size()
+    stats.counters['memcache_hits'] += hits
+    stats.counters['memcache_misses'] += request.key_size() - hits
+
+
+apiproxy_stub_map.apiproxy.GetPreCallHooks().Append(
+    'instrumentation', _preCallHook)
+apiproxy_stub_map.apiproxy.GetPostCallHooks().Append(
+    'instrumentation', _postCallHook)
+
+
+# - - - Decorators - - - - - - - - - - - - - - - - - - - - - - - -
+
+def instrumented(func):
+    """Record the cost of an endpoint method; use below @endpoints.method."""
+    @functools.wraps(func)
+    def wrapper(self, request):
+        if currentStats() is not None:
+            # called from another instrumented method; counted there
+            return func(self, request)
+        _local.stats = RequestStats(func.__name__)
+        profile = None
+        try:
+            trigger = profiling.shouldProfile(func.__name__, self)
+            if trigger:
+                profile = profiling.ProfileState(func.__name__, trigger)
+                return profiling.run(profile, func, self, request)
+            return func(self, request)
+        finally:
+            stats = _local.stats.finish()
+            _local.stats = None
+            record(stats)
+            # outside the stats, so its put isn't counted for the endpoint
+            if profile is not None:
+                profiling.store(profile)
+    return wrapper
+
+
+def serializer(func):
+    """Add the time spent in a _copy*ToForm helper to the running call."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        stats = currentStats()
+        if stats is None:
+            return func(*args, **kwargs)
+        start = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stats.counters['serialize_us'] += int(
+                (time.time() - start) * 1e6)
+    return wrapper
+
+
+# - - - Aggregates - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _publish(name):
+    """Add the endpoint name to the memcache index of known endpoints."""
+    if name in _published:
+        return
+    if casUpdate(MEMCACHE_INDEX_KEY,
+                 lambda names: sorted(set(names or []) | set([name])),
+                 MEMCACHE_NAMESPACE):
+        _published.add(name)
+
+
+def record(stats):
+    """Add the counters of one call to the memcache aggregates."""
+    offsets = {'%s:calls' % stats.name: 1,
+               '%s:%s' % (stats.name, stats.bucket): 1}
+    for counter, value in stats.counters.items():
+        offsets['%s:%s' % (stats.name, counter)] = value
+    memcache.offset_multi(offsets, namespace=MEMCACHE_NAMESPACE,
+                          initial_value=0)
+    _publish(stats.name)
+
+
+def _bucketNames():
+    return (['le_%d' % bound for bound in HISTOGRAM_BUCKETS] +
+            ['gt_%d' % HISTOGRAM_BUCKETS[-1]])
+
+
+def getAggregates():
+    """Return the per-endpoint aggregates, most expensive first."""
+    names = memcache.get(MEMCACHE_INDEX_KEY,
+                         namespace=MEMCACHE_NAMESPACE) or []
+    fields = ('calls',) + COUNTERS + tuple(_bucketNames())
+    values = memcache.get_multi(['%s:%s' % (name, field)
+                                 for name in names for field in fields],
+                                namespace=MEMCACHE_NAMESPACE)
+    endpoints = []
+    for name in names:
+        def value(field):
+            return int(values.get('%s:%s' % (name, field)) or 0)
+        calls = value('calls')
+        if not calls:
+            continue
+        totals = dict((counter, value(counter)) for counter in COUNTERS)
+        endpoints.append({
+            'endpoint': name,
+            'calls': calls,
+            'totals': totals,
+            'perCall': dict((counter, float(total) / calls)
+                            for counter, total in totals.items()),
+            'histogram': [(bucket, value(bucket))
+                          for bucket in _bucketNames()],
+        })
+    endpoints.sort(key=lambda e: e['totals']['wall_us'], reverse=True)
+    return endpoints
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+"""loadsim.py
+
+Registration contention load simulator.
+
+Starts a number of worker threads that call registerForConference and
+unregisterFromConference for the same conference against the testbed
+datastore, then reports throughput, transaction retries and aborts and
+checks that the final seat count matches the registrations (no seat is
+ever oversold).
+
+    $ APPENGINE_SDK=/path/to/google_appengine python loadsim.py \
+          --users 200 --seats 50 --threads 16 --calls 50
+
+"""
+
+import argparse
+import random
+import threading
+import time
+from collections import defaultdict
+
+import localenv
+
+
+class Counters(object):
+    """Thread-safe outcome and RPC counters."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = defaultdict(int)
+
+    def add(self, name, value=1):
+        with self.lock:
+            self.values[name] += value
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+
+def _createConference(seats):
+    from google.appengine.ext import ndb
+    from models import Conference
+    from models import Profile
+
+    organizer = Profile(key=ndb.Key(Profile, 'organizer@example.com'),
+                        displayName='Organizer',
+                        mainEmail='organizer@example.com')
+    organizer.put()
+    conf = Conference(parent=organizer.key, name='Contended conference',
+                      organizerUserId=organizer.key.id(), month=0,
+                      maxAttendees=seats, seatsAvailable=seats)
+    conf.put()
+    return conf.key
+
+
+def _worker(api, request, emails, calls, register_ratio, counters, seed):
+    import endpoints
+    from google.appengine.api import datastore_errors
+    from google.appengine.ext import ndb
+
+    rng = random.Random(seed)
+    for _ in range(calls):
+        localenv.signIn(rng.choice(emails))
+        ndb.get_context().clear_cache()
+        register = rng.random() < register_ratio
+        try:
+            if register:
+                api.registerForConference(request)
+                counters.add('registered')
+            elif api.unregisterFromConference(request).data:
+                counters.add('unregistered')
+            else:
+                counters.add('not registered')
+        except datastore_errors.TransactionFailedError:
+            counters.add('aborted')
+        except endpoints.ServiceException as e:
+            # sold out or already registered
+            counters.add('rejected (%s)' % e.__class__.__name__)
+        counters.add('calls')
+
+
+def _checkSeats(conf_key, emails):
+    """Return (ok, message) comparing seats with the stored registrations."""
+    from google.appengine.ext import ndb
+    from models import Profile
+
+    ndb.get_context().clear_cache()
+    conf = conf_key.get()
+    wsck = conf_key.urlsafe()
+    profiles = [p for p in ndb.get_multi([ndb.Key(Profile, email)
+                                          for email in emails]) if p]
+    registered = sum(p.conferenceKeysToAttend.count(wsck) for p in profiles)
+    duplicates = sum(1 for p in profiles
+                     if p.conferenceKeysToAttend.count(wsck) > 1)
+    expected = conf.maxAttendees - registered
+    ok = (conf.seatsAvailable == expected and conf.seatsAvailable >= 0 and
+          not duplicates)
+    return ok, ('seats available %d, registered %d of %d, expected %d '
+                'seats, %d duplicate registrations' % (
+                    conf.seatsAvailable, registered, conf.maxAttendees,
+                    expected, duplicates))
+
+
+def run(users, seats, threads, calls, register_ratio, seed,
+        throttle=False):
+    from google.appengine.api import apiproxy_stub_map
+    from conference import CONF_GET_REQUEST
+    from conference import ConferenceApi
+    import contention
+    import ratelimit
+
+    if not throttle:
+        # measure the datastore contention, not the admission control
+        ratelimit.LIMITS = {}
+    counters = Counters()
+
+    def countTransactions(service, call, request, response):
+        if call == 'BeginTransaction':
+            counters.add('transaction attempts')
+        elif call == 'Rollback':
+            counters.add('rollbacks')
+
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Append(
+        'loadsim', countTransactions, 'datastore_v3')
+
+    conf_key = _createConference(seats)
+    request = CONF_GET_REQUEST.combined_message_class(
+        websafeConferenceKey=conf_key.urlsafe())
+    emails = ['user%d@example.com' % i for i in range(users)]
+    api = ConferenceApi()
+
+    workers = [threading.Thread(target=_worker,
+                                args=(api, request, emails, calls,
+                                      register_ratio, counters, seed + i))
+               for i in range(threads)]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - start
+
+    ok, message = _checkSeats(conf_key, emails)
+    print('%d calls in %.2fs: %.1f calls/s' % (
+        counters['calls'], elapsed, counters['calls'] / elapsed))
+    for name in sorted(counters.values):
+        if name != 'calls':
+            print('  %-28s %d' % (name, counters[name]))
+    transactions = contention.getReport()['transactions']
+    # counted by contention.transactional when it actually retries
+    print('  %-28s %d' % ('transaction retries',
+                          sum(transaction['totals']['retries']
+                              for transaction in transactions)))
+    for transaction in transactions:
+        print('  %-28s %d collisions, %d retries in %d attempts' % (
+            transaction['transaction'],
+            transaction['totals']['collisions'],
+            transaction['totals']['retries'],
+            transaction['totals']['attempts']))
+    print('%s: %s' % ('OK' if ok else 'OVERSOLD/INCONSISTENT', message))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--sdk', default=localenv.SDK_PATH,
+                        help='App Engine SDK directory')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--seats', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--calls', type=int, default=50,
+                        help='calls per thread')
+    parser.add_argument('--register-ratio', type=float, default=0.7,
+                        help='share of calls that register (vs unregister)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--throttle', action='store_true',
+                        help='keep the endpoint rate limits enabled')
+    args = parser.parse_args()
+
+    localenv.fixSysPath(args.sdk)
+    with localenv.LocalEnvironment():
+        ok = run(args.users, args.seats, args.threads, args.calls,
+                 args.register_ratio, args.seed, args.throttle)
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
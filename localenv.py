@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+"""localenv.py
+
+Local stand-ins for running ConferenceApi outside of App Engine: activates
+the SDK testbed stubs for ndb, memcache, taskqueue and mail, replaces the
+Cloud Endpoints user lookup with a per-thread test user and generates
+synthetic conferences, sessions, speakers and profiles.
+
+Used by the offline tools (benchmark.py) and the unit tests in tests/;
+never imported by the app itself.
+
+"""
+
+import os
+import random
+import sys
+import threading
+from datetime import date
+from datetime import time
+from datetime import timedelta
+
+# the SDK location can be given with APPENGINE_SDK; default to the
+# place the Cloud SDK installs it
+SDK_PATH = os.environ.get(
+    'APPENGINE_SDK',
+    '/usr/local/google_appengine')
+
+
+def fixSysPath(sdk_path=SDK_PATH):
+    """Put the App Engine SDK and its bundled libraries on sys.path."""
+    if sdk_path not in sys.path:
+        sys.path.insert(0, sdk_path)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+
+
+_local = threading.local()
+
+
+def signIn(email):
+    """Make `email` the Endpoints user of the calling thread."""
+    _local.email = email
+
+
+def signOut():
+    """Remove the Endpoints user of the calling thread."""
+    _local.email = None
+
+
+def _getCurrentUser():
+    """Stand-in for endpoints.get_current_user()."""
+    from google.appengine.api import users
+    email = getattr(_local, 'email', None)
+    if not email:
+        return None
+    return users.User(email=email, _auth_domain='gmail.com')
+
+
+class LocalEnvironment(object):
+    """Testbed with all service stubs used by the conference app."""
+
+    def __init__(self, root_path=None):
+        self.root_path = root_path or os.path.dirname(os.path.abspath(
+            __file__))
+        self.testbed = None
+
+    def activate(self):
+        import endpoints
+        from google.appengine.datastore import datastore_stub_util
+        from google.appengine.ext import testbed
+
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.setup_env(app_id='lisas-first-ae-app',
+                               overwrite=True)
+        # every write is immediately visible to global queries
+        policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+            probability=1)
+        self.testbed.init_datastore_v3_stub(consistency_policy=policy)
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub(root_path=self.root_path)
+        self.testbed.init_app_identity_stub()
+        self.testbed.init_mail_stub()
+        self.testbed.init_user_stub()
+        self.testbed.init_urlfetch_stub()
+        endpoints.get_current_user = _getCurrentUser
+        return self
+
+    def deactivate(self):
+        if self.testbed:
+            self.testbed.deactivate()
+            self.testbed = None
+
+    def __enter__(self):
+        return self.activate()
+
+    def __exit__(self, *exc_info):
+        self.deactivate()
+
+
+# - - - Synthetic data - - - - - - - - - - - - - - - - - - - - - -
+
+CITIES = ['Chicago', 'London', 'Paris', 'San Francisco', 'Tokyo']
+TOPICS = ['Medical Innovations', 'Programming Languages',
+          'Web Technologies', 'Movie Making', 'Health and Nutrition']
+SESSION_TYPES = ['lecture', 'keynote', 'workshop', 'panel']
+WORDS = ['cloud', 'scale', 'python', 'data', 'design', 'future',
+         'health', 'mobile', 'security', 'film', 'nutrition', 'web',
+         'angular', 'storage', 'network', 'learning', 'startup']
+
+
+class SyntheticData(object):
+    """Generate a reproducible data set at a configurable scale.
+
+    The entities are written directly with ndb so that generating a large
+    data set does not go through (and is not measured as) the API.
+    """
+
+    def __init__(self, profiles=50, conferences=100, sessions=10,
+                 speakers=40, registrations=5, wishlist=10, seed=0):
+        self.num_profiles = profiles
+        self.num_conferences = conferences
+        self.sessions_per_conference = sessions
+        self.num_speakers = speakers
+        self.registrations_per_profile = registrations
+        self.wishlist_per_profile = wishlist
+        self.rng = random.Random(seed)
+        self.emails = []
+        self.conference_keys = []
+        self.session_keys = []
+        self.speaker_names = []
+
+    def _words(self, count):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(count))
+
+    def generate(self):
+        from google.appengine.ext import ndb
+        from models import Conference
+        from models import Profile
+        from models import Session
+        from models import Speaker
+
+        rng = self.rng
+        profiles = []
+        for i in range(self.num_profiles):
+            email = 'user%d@example.com' % i
+            self.emails.append(email)
+            profiles.append(Profile(key=ndb.Key(Profile, email),
+                                    displayName='User %d' % i,
+                                    mainEmail=email))
+
+        speakers = []
+        for i in range(self.num_speakers):
+            name = 'Speaker %d' % i
+            self.speaker_names.append(name)
+            speakers.append(Speaker(name=name,
+                                    title=self._words(2),
+                                    description=self._words(20),
+                                    topics=rng.sample(TOPICS, 2)))
+        ndb.put_multi(speakers)
+
+        conferences = []
+        sessions = []
+        today = date.today()
+        for i in range(self.num_conferences):
+            organizer = profiles[i % len(profiles)]
+            start = today + timedelta(days=rng.randint(-365, 365))
+            seats = rng.choice([0, 5, 50, 200, 1000])
+            conf = Conference(
+                key=ndb.Key(Conference, i + 1, parent=organizer.key),
+                name='%s conference %d' % (self._words(2).title(), i),
+                description=self._words(60),
+                organizerUserId=organizer.key.id(),
+                topics=rng.sample(TOPICS, rng.randint(1, 3)),
+                city=rng.choice(CITIES),
+                startDate=start,
+                month=start.month,
+                endDate=start + timedelta(days=rng.randint(0, 4)),
+                maxAttendees=seats,
+                seatsAvailable=seats)
+            conferences.append(conf)
+            self.conference_keys.append(conf.key)
+            for j in range(self.sessions_per_conference):
+                session = Session(
+                    key=ndb.Key(Session, j + 1, parent=conf.key),
+                    name=self._words(3).title(),
+                    highlights=rng.sample(WORDS, 3),
+                    speaker=rng.choice(self.speaker_names),
+                    type=rng.choice(SESSION_TYPES),
+                    duration=rng.choice([30, 45, 60, 90]),
+                    date=conf.startDate + timedelta(
+                        days=rng.randint(0, 2)),
+                    startTime=time(rng.randint(8, 20),
+                                   rng.choice([0, 15, 30, 45])))
+                sessions.append(session)
+                self.session_keys.append(session.key)
+        ndb.put_multi(conferences)
+        ndb.put_multi(sessions)
+
+        for profile in profiles:
+            picks = rng.sample(
+                conferences,
+                min(self.registrations_per_profile, len(conferences)))
+            for conf in picks:
+                if conf.seatsAvailable > 0:
+                    profile.conferenceKeysToAttend.append(conf.key.urlsafe())
+                    conf.seatsAvailable -= 1
+            profile.sessionWishlist = [
+                key.urlsafe() for key in rng.sample(
+                    self.session_keys,
+                    min(self.wishlist_per_profile, len(self.session_keys)))]
+        ndb.put_multi(profiles)
+        ndb.put_multi(conferences)
+        return self
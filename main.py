@@ -1,7 +1,23 @@
+import json
+import logging
+import time
+
+# taken before the heavy imports; reported by the warmup handler
+INSTANCE_STARTED = time.time()
+
 import webapp2
-from google.appengine.api import app_identity
-from google.appengine.api import mail
-from conference import ConferenceApi
+from google.appengine.api import memcache
+import archive
+import contention
+import facets
+import icalfeed
+import idempotency
+import instrumentation
+import migrations
+import profiling
+import sessiondays
+import textsearch
+import workers
 
 # !/usr/bin/env python
 
@@ -18,37 +34,231 @@ created by wesc on 2014 may 24
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
 
+class WarmupHandler(webapp2.RequestHandler):
+    def get(self):
+        """Load the API & prime the caches before traffic arrives."""
+        timings = []
+
+        def step(name, func):
+            start = time.time()
+            func()
+            timings.append((name, (time.time() - start) * 1000))
+
+        # the API module is only imported here, so that cron & task
+        # requests don't pay for the Endpoints import chain
+        step('api import', lambda: __import__('conference'))
+        import conference
+        step('serializer tables', conference.buildSerializerTables)
+        if memcache.get(workers.MEMCACHE_ANNOUNCEMENTS_KEY) is None:
+            step('announcement', workers.cacheAnnouncement)
+        step('featured speaker', workers.primeFeaturedSpeaker)
+        if memcache.get(workers.MEMCACHE_UPCOMING_KEY) is None:
+            step('upcoming conferences', workers.cacheUpcomingConferences)
+
+        report = ['%-24s %8.1f ms' % timing for timing in timings]
+        report.append('%-24s %8.1f ms' % (
+            'since instance start', (time.time() - INSTANCE_STARTED) * 1000))
+        logging.info('warmup:\n%s', '\n'.join(report))
+        self.response.headers['Content-Type'] = 'text/plain'
+        self.response.write('\n'.join(report) + '\n')
+
+
 class SetAnnouncementHandler(webapp2.RequestHandler):
     def get(self):
         """Set Announcement in Memcache."""
-        ConferenceApi._cacheAnnouncement()
+        workers.cacheAnnouncement()
+        self.response.set_status(204)
+
+
+class SetUpcomingConferencesHandler(webapp2.RequestHandler):
+    def get(self):
+        """Set upcoming conferences in Memcache."""
+        workers.cacheUpcomingConferences()
+        self.response.set_status(204)
+
+    def post(self):
+        """Set upcoming conferences in Memcache (task queue)."""
+        self.get()
+
+
+class ArchiveConferencesHandler(webapp2.RequestHandler):
+    def get(self):
+        """Flag the conferences that are over as archived."""
+        # App Engine strips the header from outside requests, so visiting
+        # the URL in an admin's browser doesn't run the job
+        if self.request.headers.get('X-Appengine-Cron') != 'true':
+            self.abort(403)
+        logging.info('archived %d conferences',
+                     archive.archivePastConferences())
+        self.response.set_status(204)
+
+
+class PurgeIdempotencyKeysHandler(webapp2.RequestHandler):
+    def get(self):
+        """Delete the stored results of expired idempotency keys."""
+        logging.info('purged %d idempotent results',
+                     idempotency.purgeExpired())
         self.response.set_status(204)
 
 
 class SendConfirmationEmailHandler(webapp2.RequestHandler):
     def post(self):
         """Send email confirming Conference creation."""
-        mail.send_mail(
-            'noreply@%s.appspotmail.com' % (
-                app_identity.get_application_id()),     # from
-            self.request.get('email'),                  # to
-            'You created a new Conference!',            # subj
-            'Hi, you have created a following '         # body
-            'conference:\r\n\r\n%s' % self.request.get(
-                'conferenceInfo')
-        )
+        workers.sendConfirmationEmail(self.request.get('email'),
+                                      self.request.get('conferenceInfo'))
 
 
 class SetFeaturedSpeakerHandler(webapp2.RequestHandler):
     def get(self):
         """Set Featured Speaker in Memcache"""
-        ConferenceApi._cacheFeaturedSpeaker(self.request.get('speaker'),
-                                            self.request.get('sessions'))
+        workers.cacheFeaturedSpeaker(self.request.get('speaker'),
+                                     self.request.get('sessions'))
         self.response.set_status(204)
 
 
+class IndexDocumentHandler(webapp2.RequestHandler):
+    def post(self):
+        """Update the search index postings of a conference/session."""
+        textsearch.indexDocument(self.request.get('websafeKey'))
+
+
+class UpdateSessionDayHandler(webapp2.RequestHandler):
+    def post(self):
+        """Move a session to the schedule index bucket of its date."""
+        sessiondays.updateSession(self.request.get('websafeSessionKey'),
+                                  self.request.get('oldDate') or None)
+
+
+class UpdateFacetsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Apply conference facet count changes."""
+        facets.applyDeltas(json.loads(self.request.get('deltas')),
+                           self.request.headers.get('X-AppEngine-TaskName'))
+
+
+class CalendarFeedHandler(webapp2.RequestHandler):
+    def get(self, token):
+        """Serve the iCalendar feed of the profile with this token."""
+        feed = icalfeed.getFeed(token)
+        if feed is None:
+            self.abort(404)
+        etag, text = feed
+        self.response.etag = etag
+        self.response.headers['Cache-Control'] = (
+            'private, max-age=%d' % icalfeed.MAX_AGE)
+        if etag in self.request.if_none_match:
+            self.response.set_status(304)
+            return
+        self.response.headers['Content-Type'] = 'text/calendar; charset=utf-8'
+        self.response.write(text)
+
+
+class EndpointStatsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Return per-endpoint cost aggregates as JSON."""
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(
+            {'endpoints': instrumentation.getAggregates()}, indent=2))
+
+
+class MigrateHandler(webapp2.RequestHandler):
+    def post(self):
+        """Migrate one batch of entities (task queue)."""
+        migrations.runBatch(self.request.get('name'),
+                            self.request.get('run'),
+                            int(self.request.get('batch')))
+
+
+class MigrationsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Return the migrations & their progress as JSON."""
+        self._writeStatus()
+
+    def post(self):
+        """Apply an action (start, pause or resume) to the migration
+           `name`, then return the progress like GET."""
+        action = self.request.get('action')
+        name = self.request.get('name')
+        if name not in migrations.MIGRATIONS or action not in (
+                'start', 'pause', 'resume'):
+            self.abort(400)
+        if action == 'start':
+            migrations.start(
+                name, dry_run=bool(self.request.get('dryRun')),
+                delay=float(self.request.get('delay') or 0))
+        else:
+            getattr(migrations, action)(name)
+        self._writeStatus()
+
+    def _writeStatus(self):
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(
+            {'migrations': migrations.getStatus()}, indent=2))
+
+
+class PurgeProfilesHandler(webapp2.RequestHandler):
+    def get(self):
+        """Delete the expired request profiles."""
+        logging.info('purged %d request profiles', profiling.purgeExpired())
+        self.response.set_status(204)
+
+
+class ProfilesHandler(webapp2.RequestHandler):
+    def get(self):
+        """Return the latest request profiles (of the endpoint given)
+           as JSON."""
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps({'profiles': profiling.listProfiles(
+            self.request.get('endpoint') or None)}, indent=2))
+
+
+class ProfileHandler(webapp2.RequestHandler):
+    def get(self, profile_id, ext):
+        """Return a request profile as JSON, or its raw pstats data."""
+        profile = profiling.getProfile(int(profile_id))
+        if profile is None:
+            self.abort(404)
+        if ext == '.pstats':
+            if profile.stats is None:
+                self.abort(404)
+            self.response.headers['Content-Type'] = (
+                'application/octet-stream')
+            self.response.headers['Content-Disposition'] = (
+                'attachment; filename=%s-%s.pstats' % (profile.endpoint,
+                                                       profile_id))
+            self.response.write(profile.stats)
+            return
+        result = profiling.summary(profile, None)
+        result['slowestRpcs'] = profile.rpcs['slowest']
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(result, indent=2))
+
+
+class ContentionStatsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Return transaction collision counters & hotspots as JSON."""
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(contention.getReport(), indent=2))
+
+
 app = webapp2.WSGIApplication([
+    ('/_ah/warmup', WarmupHandler),
     ('/crons/set_announcement', SetAnnouncementHandler),
+    ('/crons/set_upcoming_conferences', SetUpcomingConferencesHandler),
+    ('/crons/purge_idempotency_keys', PurgeIdempotencyKeysHandler),
+    ('/crons/archive_conferences', ArchiveConferencesHandler),
+    ('/crons/purge_profiles', PurgeProfilesHandler),
+    ('/tasks/set_upcoming_conferences', SetUpcomingConferencesHandler),
     ('/tasks/send_confirmation_email', SendConfirmationEmailHandler),
     ('/tasks/set_featured_speaker', SetFeaturedSpeakerHandler),
+    ('/tasks/index_document', IndexDocumentHandler),
+    ('/tasks/update_facets', UpdateFacetsHandler),
+    ('/tasks/update_session_day', UpdateSessionDayHandler),
+    ('/tasks/migrate', MigrateHandler),
+    (r'/calendar/(\w+)\.ics', CalendarFeedHandler),
+    ('/admin/stats', EndpointStatsHandler),
+    ('/admin/contention', ContentionStatsHandler),
+    ('/admin/migrations', MigrationsHandler),
+    ('/admin/profiles', ProfilesHandler),
+    (r'/admin/profiles/(\d+)(\.pstats)?', ProfileHandler),
 ], debug=True)
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+
+"""migrations.py
+
+Resumable, batched data migrations.
+
+A migration is a function registered with @migration for a model; it gets
+one entity at a time, changes it in place and returns True if it did.
+Running a migration walks all entities of the model in key order, one
+batch per task on the task queue: the changed entities of a batch are
+written with a single put_multi, then the query cursor and counters are
+checkpointed in the MigrationState entity named after the migration and
+the next task is enqueued, `delay` seconds later to limit the write
+rate. A failed batch is retried by the task queue from the last
+checkpoint, so migration functions (and `after` and `end` hooks) must
+be idempotent. A dry run counts what would change without writing anything.
+
+Migrations are started, paused, resumed and monitored from the admin
+migrations handler in main.py.
+
+"""
+
+import collections
+import logging
+import uuid
+from datetime import datetime
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import Conference
+from models import MigrationState
+from models import Session
+
+import archive
+import facets
+import sessiondays
+import textsearch
+
+BATCH_SIZE = 100
+TASK_URL = '/tasks/migrate'
+
+RUNNING = 'running'
+PAUSED = 'paused'
+DONE = 'done'
+
+Migration = collections.namedtuple(
+    'Migration', ['name', 'model', 'func', 'batch_size', 'write', 'begin',
+                  'after', 'end', 'description'])
+
+# name -> Migration, in registration order
+MIGRATIONS = collections.OrderedDict()
+
+
+def migration(name, model, batch_size=BATCH_SIZE, write=True, begin=None,
+              after=None, end=None):
+    """Register the decorated function as the migration `name` of the
+    model. With write=False the changed entities aren't put (for
+    migrations acting through `after` only); begin() is called when a run
+    starts, after(changed) with the changed entities of every batch and
+    end() when the run is done, all except in dry runs."""
+    def decorator(func):
+        MIGRATIONS[name] = Migration(name, model, func, batch_size, write,
+                                     begin, after, end,
+                                     (func.__doc__ or '').strip())
+        return func
+    return decorator
+
+
+def _enqueue(state):
+    """Enqueue the next batch; named after it so that it's only
+    enqueued once, even when a batch is retried."""
+    name = state.key.id()
+    try:
+        taskqueue.add(url=TASK_URL,
+                      name='migrate-%s-%s-%d' % (name.replace('_', '-'),
+                                                 state.run, state.batches),
+                      params={'name': name, 'run': state.run,
+                              'batch': state.batches},
+                      countdown=state.delay)
+    except (taskqueue.TaskAlreadyExistsError,
+            taskqueue.TombstonedTaskError):
+        pass
+
+
+def start(name, dry_run=False, delay=0.0):
+    """Start the migration from the beginning; a run in progress is
+    abandoned."""
+    if name not in MIGRATIONS:
+        raise ValueError('No migration named %s' % name)
+    state = MigrationState(id=name, run=uuid.uuid4().hex, status=RUNNING,
+                           dryRun=dry_run, delay=delay,
+                           started=datetime.now())
+    state.put()
+    spec = MIGRATIONS[name]
+    if spec.begin and not dry_run:
+        spec.begin()
+    _enqueue(state)
+    return state
+
+
+@ndb.transactional
+def _setStatus(name, status):
+    state = MigrationState.get_by_id(name)
+    if state is None or state.status == DONE:
+        return state
+    state.status = status
+    if status == RUNNING:
+        # a new task chain; tasks of the previous one stop by themselves
+        state.run = uuid.uuid4().hex
+        state.error = None
+    state.put()
+    return state
+
+
+def pause(name):
+    """Stop the migration after the running batch."""
+    return _setStatus(name, PAUSED)
+
+
+def resume(name):
+    """Continue a paused (or stuck) migration from its checkpoint."""
+    state = _setStatus(name, RUNNING)
+    if state is not None and state.status == RUNNING:
+        _enqueue(state)
+    return state
+
+
+@ndb.transactional
+def _checkpoint(name, run, batch, cursor, more, processed, changed):
+    """Save the progress of a batch; None if the run was replaced or
+       the batch already checkpointed."""
+    state = MigrationState.get_by_id(name)
+    if state is None or state.run != run or state.batches != batch:
+        return None
+    state.cursor = cursor.urlsafe() if more and cursor else None
+    state.batches += 1
+    state.processed += processed
+    state.changed += changed
+    state.error = None
+    if state.cursor is None:
+        state.status = DONE
+    state.put()
+    return state
+
+
+@ndb.transactional
+def _recordError(name, run, error):
+    state = MigrationState.get_by_id(name)
+    if state is not None and state.run == run:
+        state.error = error
+        state.put()
+
+
+def runBatch(name, run, batch):
+    """Migrate batch number `batch` of the run; used by the task."""
+    state = MigrationState.get_by_id(name)
+    # a done run gets here again if its end hook failed
+    if state is None or state.run != run or state.status == PAUSED:
+        return
+    if state.batches == batch:
+        spec = MIGRATIONS[name]
+        try:
+            entities, cursor, more = spec.model.query().fetch_page(
+                spec.batch_size,
+                start_cursor=(state.cursor and
+                              ndb.Cursor(urlsafe=state.cursor)))
+            changed = [entity for entity in entities if spec.func(entity)]
+            if not state.dryRun:
+                if spec.write:
+                    ndb.put_multi(changed)
+                if spec.after:
+                    spec.after(changed)
+        except Exception as e:
+            # retried by the task queue from the same checkpoint
+            _recordError(name, run, '%s: %s' % (type(e).__name__, e))
+            raise
+        state = _checkpoint(name, run, batch, cursor, more,
+                            len(entities), len(changed))
+        if state is None:
+            return
+        logging.info('migration %s: batch %d, %d processed, %d changed%s',
+                     name, batch, len(entities), len(changed),
+                     ' (dry run)' if state.dryRun else '')
+    elif state.batches != batch + 1:
+        return
+    # this batch is checkpointed, make sure the next one is enqueued
+    if state.status == RUNNING:
+        _enqueue(state)
+    elif state.status == DONE and not state.dryRun:
+        spec = MIGRATIONS[name]
+        if spec.end:
+            spec.end()
+
+
+def getStatus():
+    """Return the registered migrations with their progress."""
+    states = ndb.get_multi([ndb.Key(MigrationState, name)
+                            for name in MIGRATIONS])
+    status = []
+    for spec, state in zip(MIGRATIONS.values(), states):
+        item = {
+            'name': spec.name,
+            'kind': spec.model._get_kind(),
+            'description': spec.description,
+            'batchSize': spec.batch_size,
+        }
+        if state is not None:
+            item.update(state.to_dict(exclude=['cursor', 'run']))
+            for field in ('started', 'updated'):
+                if item[field]:
+                    item[field] = item[field].isoformat()
+        status.append(item)
+    return status
+
+
+# - - - Migrations - - - - - - - - - - - - - - - - - - - - - - - -
+
+@migration('conference_archived', Conference)
+def writeArchived(conf):
+    """Write the archived flag of every conference. Conferences stored
+    before the flag existed aren't in the indexes on archived, so the
+    default queries can't see them until rewritten. Run facet_recount and
+    reindex_conferences afterwards."""
+    archived = archive.isPast(conf)
+    if 'archived' in conf._values and conf.archived == archived:
+        return False
+    conf.archived = archived
+    return True
+
+
+@migration('facet_recount', Conference, write=False,
+           begin=facets.startRecount, after=facets.addConferences,
+           end=facets.finishRecount)
+def recountFacets(conf):
+    """Rebuild the facet counts from scratch: every conference is counted
+    into a new generation of counters, which replaces the current one
+    when the run is done. Updates keep both up to date meanwhile."""
+    return True
+
+
+def _reindex(entities):
+    for entity in entities:
+        textsearch.enqueueIndexing(entity.key)
+
+
+@migration('reindex_conferences', Conference, write=False, after=_reindex)
+def reindexConference(conf):
+    """Rebuild the search index postings of every conference."""
+    return True
+
+
+@migration('reindex_sessions', Session, write=False, after=_reindex)
+def reindexSession(session):
+    """Rebuild the search index postings of every session."""
+    return True
+
+
+@migration('session_days', Session, write=False,
+           after=sessiondays.addSessions)
+def indexSessionDay(session):
+    """Put every dated session into the schedule index (sessiondays)."""
+    return bool(session.date)
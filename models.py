@@ -1,6 +1,7 @@
-import httplib
-import endpoints
+import time
+
 from protorpc import messages
+from google.appengine.api import memcache
 from google.appengine.ext import ndb
 
 # !/usr/bin/env python
@@ -18,11 +19,6 @@ created/forked from conferences.py by wesc on 2014 may 24
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
 
-class ConflictException(endpoints.ServiceException):
-    """ConflictException -- exception mapped to HTTP 409 response"""
-    http_status = httplib.CONFLICT
-
-
 class Profile(ndb.Model):
     """Profile -- User profile object"""
     displayName = ndb.StringProperty()
@@ -30,6 +26,20 @@ class Profile(ndb.Model):
     teeShirtSize = ndb.StringProperty(default='NOT_SPECIFIED')
     conferenceKeysToAttend = ndb.StringProperty(repeated=True)
     sessionWishlist = ndb.StringProperty(repeated=True)
+    # incremented on every put; part of the client change token
+    version = ndb.IntegerProperty(default=0, indexed=False)
+    # secret of the iCalendar feed url (see icalfeed.py)
+    calendarToken = ndb.StringProperty()
+
+    def _pre_put_hook(self):
+        self.version += 1
+
+    def _post_put_hook(self, future):
+        # drop the rendered feed once the change is committed
+        if self.calendarToken:
+            key = MEMCACHE_CALENDAR_TPL % self.calendarToken
+            ndb.get_context().call_on_commit(
+                lambda: memcache.delete(key))
 
 
 class ProfileMiniForm(messages.Message):
@@ -45,6 +55,7 @@ class ProfileForm(messages.Message):
     teeShirtSize = messages.EnumField('TeeShirtSize', 3)
     conferenceKeysToAttend = messages.StringField(4, repeated=True)
     sessionWishlist = messages.StringField(5, repeated=True)
+    changeToken = messages.StringField(6)
 
 
 class StringMessage(messages.Message):
@@ -69,6 +80,17 @@ class Conference(ndb.Model):
     endDate = ndb.DateProperty()
     maxAttendees = ndb.IntegerProperty()
     seatsAvailable = ndb.IntegerProperty()
+    # set once the conference is over (see archive.py)
+    archived = ndb.BooleanProperty(default=False)
+    # incremented on every put (see icalfeed.py)
+    version = ndb.IntegerProperty(default=0, indexed=False)
+
+    def _pre_put_hook(self):
+        self.version += 1
+
+    def _post_put_hook(self, future):
+        ndb.get_context().call_on_commit(
+            lambda: bumpKindVersion('Conference'))
 
 
 class ConferenceForm(messages.Message):
@@ -89,9 +111,32 @@ class ConferenceForm(messages.Message):
     organizerDisplayName = messages.StringField(12)
 
 
+class ColumnForm(messages.Message):
+    """ColumnForm -- one field of a compact list, a value per item
+       (see compact.py)"""
+    field = messages.StringField(1)
+    encoding = messages.StringField(2)
+    strings = messages.StringField(3, repeated=True)
+    values = messages.IntegerField(4, repeated=True,
+                                   variant=messages.Variant.INT32)
+    lengths = messages.IntegerField(5, repeated=True,
+                                    variant=messages.Variant.INT32)
+
+
+class CompactListForm(messages.Message):
+    """CompactListForm -- list of forms encoded as columns"""
+    count = messages.IntegerField(1, variant=messages.Variant.INT32)
+    dictionary = messages.StringField(2, repeated=True)
+    columns = messages.MessageField(ColumnForm, 3, repeated=True)
+
+
 class ConferenceForms(messages.Message):
     """ConferenceForms -- multiple Conference outbound form message"""
     items = messages.MessageField(ConferenceForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+    changeToken = messages.StringField(3)
+    # instead of items, when requested
+    compact = messages.MessageField(CompactListForm, 4)
 
 
 class TeeShirtSize(messages.Enum):
@@ -124,6 +169,11 @@ class ConferenceQueryForms(messages.Message):
     """ConferenceQueryForms --
        multiple ConferenceQueryForm inbound form message"""
     filters = messages.MessageField(ConferenceQueryForm, 1, repeated=True)
+    fields = messages.StringField(2, repeated=True)
+    # query the archived (past) conferences instead of the live ones
+    archived = messages.BooleanField(3, default=False)
+    # return the list compact (see compact.py)
+    compact = messages.BooleanField(4, default=False)
 
 
 class Session(ndb.Model):
@@ -135,6 +185,15 @@ class Session(ndb.Model):
     duration = ndb.IntegerProperty()
     date = ndb.DateProperty()
     startTime = ndb.TimeProperty()
+    # incremented on every put (see icalfeed.py)
+    version = ndb.IntegerProperty(default=0, indexed=False)
+
+    def _pre_put_hook(self):
+        self.version += 1
+
+    def _post_put_hook(self, future):
+        ndb.get_context().call_on_commit(
+            lambda: bumpKindVersion('Session'))
 
 
 class SessionForm(messages.Message):
@@ -153,6 +212,30 @@ class SessionForm(messages.Message):
 class SessionForms(messages.Message):
     """SessionForms -- multiple Session outbound form message"""
     items = messages.MessageField(SessionForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+    changeToken = messages.StringField(3)
+    # instead of items, when requested
+    compact = messages.MessageField(CompactListForm, 4)
+
+
+class SessionDay(ndb.Model):
+    """SessionDay -- start & end minute of a shard of the sessions of
+       all conferences on a date, by websafe key; keyed by
+       'YYYY-MM-DD:<shard>'"""
+    sessions = ndb.JsonProperty()
+
+
+class SessionConflictForm(messages.Message):
+    """SessionConflictForm -- two overlapping sessions, the one starting
+       first first, and for how many minutes they overlap"""
+    sessions = messages.MessageField(SessionForm, 1, repeated=True)
+    overlapMinutes = messages.IntegerField(2)
+
+
+class SessionConflictForms(messages.Message):
+    """SessionConflictForms -- multiple SessionConflictForm outbound
+       form message"""
+    items = messages.MessageField(SessionConflictForm, 1, repeated=True)
 
 
 class Speaker(ndb.Model):
@@ -169,3 +252,151 @@ class SpeakerForm(messages.Message):
     title = messages.StringField(2)
     description = messages.StringField(3)
     topics = messages.StringField(4, repeated=True)
+
+
+class SearchPosting(ndb.Model):
+    """SearchPosting -- weight of a token in an entity; keyed by
+       '<kind>:<token>:<websafe key of the entity>'"""
+    token = ndb.StringProperty()
+    weight = ndb.IntegerProperty()
+
+
+class SearchDocument(ndb.Model):
+    """SearchDocument -- tokens (with weight) an entity is indexed under;
+       keyed by the websafe key of the entity"""
+    tokens = ndb.JsonProperty()
+
+
+class FacetCount(ndb.Model):
+    """FacetCount -- {facet: {value: count}} of the conferences in a
+       scope (see facets.scope); keyed by the generation of the counters
+       and the scope (see facets.counterId)"""
+    counts = ndb.JsonProperty()
+    # names of the last update tasks applied
+    tasks = ndb.StringProperty(repeated=True, indexed=False)
+
+
+class FacetState(ndb.Model):
+    """FacetState -- generation of the FacetCount counters in use and of
+       the ones a facet_recount run is building (singleton)"""
+    current = ndb.IntegerProperty(default=0, indexed=False)
+    building = ndb.IntegerProperty(indexed=False)
+
+
+class FacetRecountMark(ndb.Model):
+    """FacetRecountMark -- a conference counted into the counters a
+       facet_recount run is building; child of the conference, keyed by
+       the generation of the counters"""
+    generation = ndb.IntegerProperty()
+    # the recount batch that counted the conference, with its cells
+    batch = ndb.StringProperty(indexed=False)
+    cells = ndb.JsonProperty()
+
+
+class FacetCountForm(messages.Message):
+    """FacetCountForm -- number of conferences with a facet value"""
+    facet = messages.StringField(1)
+    value = messages.StringField(2)
+    count = messages.IntegerField(3)
+
+
+class FacetCountForms(messages.Message):
+    """FacetCountForms -- multiple FacetCountForm outbound form message"""
+    items = messages.MessageField(FacetCountForm, 1, repeated=True)
+    changeToken = messages.StringField(2)
+
+
+class FeaturedSpeaker(ndb.Model):
+    """FeaturedSpeaker -- last featured speaker (singleton), used to
+       restore the memcache entry"""
+    speaker = ndb.StringProperty(indexed=False)
+    sessions = ndb.StringProperty(indexed=False)
+
+
+class IdempotentResult(ndb.Model):
+    """IdempotentResult -- response of a create request sent with an
+       idempotency key; keyed by '<method>:<user>:<idempotency key>'"""
+    response = ndb.TextProperty()
+    created = ndb.DateTimeProperty(auto_now_add=True)
+
+
+class MigrationState(ndb.Model):
+    """MigrationState -- progress checkpoint of a data migration;
+       keyed by the migration name"""
+    run = ndb.StringProperty(indexed=False)
+    status = ndb.StringProperty(indexed=False)
+    dryRun = ndb.BooleanProperty(indexed=False, default=False)
+    delay = ndb.FloatProperty(indexed=False, default=0.0)
+    cursor = ndb.StringProperty(indexed=False)
+    batches = ndb.IntegerProperty(indexed=False, default=0)
+    processed = ndb.IntegerProperty(indexed=False, default=0)
+    changed = ndb.IntegerProperty(indexed=False, default=0)
+    error = ndb.TextProperty()
+    started = ndb.DateTimeProperty(indexed=False)
+    updated = ndb.DateTimeProperty(indexed=False, auto_now=True)
+
+
+class RequestProfile(ndb.Model):
+    """RequestProfile -- profile of one API call (see profiling.py)"""
+    endpoint = ndb.StringProperty()
+    trigger = ndb.StringProperty(indexed=False)
+    created = ndb.DateTimeProperty(auto_now_add=True)
+    wallMs = ndb.FloatProperty(indexed=False)
+    functions = ndb.JsonProperty()
+    rpcs = ndb.JsonProperty()
+    # marshalled pstats data, as written by pstats.Stats.dump_stats
+    stats = ndb.BlobProperty(compressed=True)
+
+
+class DashboardForm(messages.Message):
+    """DashboardForm -- everything the home & profile pages show
+       for the signed in user, in one outbound message"""
+    profile = messages.MessageField(ProfileForm, 1)
+    conferencesToAttend = messages.MessageField(ConferenceForm, 2,
+                                                repeated=True)
+    wishlistSessions = messages.MessageField(SessionForm, 3, repeated=True)
+    upcomingConferences = messages.MessageField(ConferenceForm, 4,
+                                                repeated=True)
+    announcement = messages.StringField(5)
+    featuredSpeaker = messages.StringField(6)
+    changeToken = messages.StringField(7)
+
+
+# ndb cache policy per model, kept in one place:
+# model -> (use memcache, memcache timeout in seconds; 0 = no expiry)
+CACHE_POLICIES = {
+    Profile: (True, 3600),
+    Conference: (True, 600),
+    Session: (True, 600),
+    Speaker: (True, 3600),
+    # only ever read by query
+    SearchPosting: (False, 0),
+    SearchDocument: (False, 0),
+    FacetCount: (False, 0),
+    FacetRecountMark: (False, 0),
+    # must see the generation switch as soon as it's committed
+    FacetState: (False, 0),
+    # cached by the idempotency module itself
+    IdempotentResult: (False, 0),
+    # read back by every batch, must see the last checkpoint
+    MigrationState: (False, 0),
+    # cached by the sessiondays module itself
+    SessionDay: (False, 0),
+    RequestProfile: (False, 0),
+}
+
+for model, (use_memcache, timeout) in CACHE_POLICIES.items():
+    model._use_memcache = use_memcache
+    model._memcache_timeout = timeout
+
+
+MEMCACHE_CALENDAR_TPL = 'CALENDAR_FEED:%s'
+MEMCACHE_KIND_VERSION_TPL = 'KIND_VERSION:%s'
+
+
+def bumpKindVersion(kind):
+    """Change the version of the whole kind (see utils.getChangeToken);
+       it restarts from the current time in ms when evicted, above the
+       versions handed out before."""
+    memcache.incr(MEMCACHE_KIND_VERSION_TPL % kind,
+                  initial_value=int(time.time() * 1000))
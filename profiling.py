@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+"""profiling.py
+
+On-demand profiling of Conference API calls.
+
+An endpoint call runs under cProfile when an app admin sends the
+X-Profile-Request header, or when it is sampled (SAMPLE_RATE, or its
+entry in SAMPLE_RATES). The functions with the most cumulative time and
+the timings of the RPCs the call issued are stored in a RequestProfile
+entity, with the raw pstats data for download, for RETENTION.
+`instrumented` calls `shouldProfile` and `run`, and its RPC hooks time
+the RPCs of the call into the ProfileState of `currentState`; it calls
+`store` once the endpoint stats of the call are recorded, so that
+storing the profile doesn't count as one of the call's RPCs. The admin
+profiles handler in main.py lists and serves the stored profiles.
+
+"""
+
+import cProfile
+import logging
+import marshal
+import os
+import pstats
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from datetime import timedelta
+
+from google.appengine.api import oauth
+
+from models import RequestProfile
+from utils import deleteAll
+
+HEADER = 'X-Profile-Request'
+EMAIL_SCOPE = 'https://www.googleapis.com/auth/userinfo.email'
+
+# fraction of the calls profiled without the header; per endpoint method
+# in SAMPLE_RATES
+SAMPLE_RATE = 0.0
+SAMPLE_RATES = {}
+
+TOP_FUNCTIONS = 40
+SLOWEST_RPCS = 20
+# raw stats bigger than this are dropped to keep the entity below 1MB
+MAX_STATS_BYTES = 800 * 1024
+RETENTION = timedelta(days=7)
+
+_local = threading.local()
+
+
+class ProfileState(object):
+    """Profiler & RPC timings of the profiled call."""
+
+    def __init__(self, name, trigger):
+        self.name = name
+        self.trigger = trigger
+        self.profiler = cProfile.Profile()
+        self.wall_ms = None
+        self.started = {}
+        self.rpcs = defaultdict(lambda: [0, 0.0])
+        self.slowest = []
+
+    def rpcStarted(self, response):
+        self.started[id(response)] = time.time()
+
+    def rpcFinished(self, service, call, response):
+        start = self.started.pop(id(response), None)
+        if start is None:
+            return
+        elapsed_ms = (time.time() - start) * 1000
+        name = '%s.%s' % (service, call)
+        self.rpcs[name][0] += 1
+        self.rpcs[name][1] += elapsed_ms
+        self.slowest.append((elapsed_ms, name))
+
+
+def currentState():
+    """Return the ProfileState of the call being profiled, if any."""
+    return getattr(_local, 'state', None)
+
+
+# - - - Profiling - - - - - - - - - - - - - - - - - - - - - - - -
+
+def shouldProfile(name, service):
+    """Return the trigger ('header' or 'sample') if the endpoint call
+       should be profiled, None otherwise."""
+    headers = getattr(service.request_state, 'headers', None)
+    if headers and headers.get(HEADER):
+        try:
+            if oauth.is_current_user_admin(EMAIL_SCOPE):
+                return 'header'
+        except oauth.Error:
+            pass
+        logging.warning('%s header from a non-admin ignored', HEADER)
+    if random.random() < SAMPLE_RATES.get(name, SAMPLE_RATE):
+        return 'sample'
+    return None
+
+
+def run(state, func, *args):
+    """Call func(*args) under the profiler of the ProfileState."""
+    _local.state = state
+    start = time.time()
+    try:
+        return state.profiler.runcall(func, *args)
+    finally:
+        state.wall_ms = (time.time() - start) * 1000
+        _local.state = None
+
+
+def store(state):
+    """Store the profile of a run."""
+    try:
+        return save(state)
+    except Exception:
+        # profiling must never be what fails a request
+        logging.exception('could not store the profile of %s', state.name)
+
+
+def _functionName(func):
+    filename, line, function = func
+    if filename == '~':
+        # built-in
+        return function
+    return '%s:%d(%s)' % (os.path.basename(filename), line, function)
+
+
+def save(state):
+    stats = pstats.Stats(state.profiler)
+    top = sorted(stats.stats.items(), key=lambda item: -item[1][3])
+    functions = [{
+        'function': _functionName(func),
+        'calls': calls,
+        'totalMs': round(total * 1000, 3),
+        'cumulativeMs': round(cumulative * 1000, 3),
+    } for func, (_, calls, total, cumulative, _) in top[:TOP_FUNCTIONS]]
+    rpcs = [{'rpc': rpc, 'calls': calls, 'totalMs': round(total_ms, 3)}
+            for rpc, (calls, total_ms) in sorted(
+                state.rpcs.items(), key=lambda item: -item[1][1])]
+    slowest = [{'rpc': rpc, 'ms': round(elapsed_ms, 3)}
+               for elapsed_ms, rpc in sorted(state.slowest,
+                                             reverse=True)[:SLOWEST_RPCS]]
+    # the format of pstats.Stats.dump_stats
+    raw = marshal.dumps(stats.stats)
+    profile = RequestProfile(
+        endpoint=state.name, trigger=state.trigger, wallMs=state.wall_ms,
+        functions=functions, rpcs={'totals': rpcs, 'slowest': slowest},
+        stats=raw if len(raw) <= MAX_STATS_BYTES else None)
+    profile.put()
+    return profile
+
+
+def getProfile(profile_id):
+    return RequestProfile.get_by_id(profile_id)
+
+
+def listProfiles(endpoint=None, limit=50):
+    """Return summaries of the latest profiles, newest first."""
+    query = RequestProfile.query()
+    if endpoint:
+        query = query.filter(RequestProfile.endpoint == endpoint)
+    query = query.order(-RequestProfile.created)
+    return [summary(profile) for profile in query.fetch(limit)]
+
+
+def purgeExpired():
+    """Delete the profiles older than RETENTION; used by a daily cron."""
+    return deleteAll(RequestProfile.query(
+        RequestProfile.created < datetime.now() - RETENTION))
+
+
+def summary(profile, functions=5):
+    return {
+        'id': profile.key.id(),
+        'endpoint': profile.endpoint,
+        'trigger': profile.trigger,
+        'created': profile.created.isoformat(),
+        'wallMs': round(profile.wallMs, 3),
+        'functions': profile.functions[:functions],
+        'rpcs': profile.rpcs['totals'],
+        'hasStats': profile.stats is not None,
+    }
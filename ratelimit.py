@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+"""ratelimit.py
+
+Token bucket admission control for the write endpoints.
+
+Every (endpoint, user) and (endpoint, conference) pair has a bucket of
+`burst` tokens in memcache that refills at `rate` tokens per second; a
+call takes one token from each of its buckets and is rejected when one is
+empty. Buckets are updated with compare-and-set. If memcache is
+unavailable or too contended, calls are let through: the limiter only
+protects the datastore and must never be what fails a request.
+
+"""
+
+import collections
+import logging
+import time
+
+from google.appengine.api import memcache
+
+MEMCACHE_NAMESPACE = 'ratelimit'
+CAS_RETRIES = 3
+
+Limit = collections.namedtuple('Limit', ['rate', 'burst'])
+
+# endpoint method -> scope ('user' or 'conference') -> Limit
+LIMITS = {
+    'registerForConference': {'user': Limit(0.5, 5),
+                              'conference': Limit(20, 100)},
+    'unregisterFromConference': {'user': Limit(0.5, 5),
+                                 'conference': Limit(20, 100)},
+    'addSessionToWishlist': {'user': Limit(1, 10)},
+    'saveProfile': {'user': Limit(0.5, 5)},
+}
+
+# websafeConferenceKey -> Limit; replaces the 'conference' limit of every
+# endpoint for conferences that need more (or less) room
+CONFERENCE_LIMITS = {}
+
+
+def _take(bucket, limit):
+    """Take a token from the bucket; False if there is none left."""
+    client = memcache.Client()
+    # an idle bucket is full again after this long
+    ttl = int(limit.burst / limit.rate) + 1
+    for i in range(CAS_RETRIES):
+        now = time.time()
+        state = client.gets(bucket, namespace=MEMCACHE_NAMESPACE)
+        if state is None:
+            if client.add(bucket, (limit.burst - 1, now), time=ttl,
+                          namespace=MEMCACHE_NAMESPACE):
+                return True
+            continue
+        tokens, stamp = state
+        tokens = min(limit.burst, tokens + (now - stamp) * limit.rate)
+        if tokens < 1:
+            return False
+        if client.cas(bucket, (tokens - 1, now), time=ttl,
+                      namespace=MEMCACHE_NAMESPACE):
+            return True
+    return True
+
+
+def admit(endpoint, user_id=None, conference_key=None):
+    """Return True if the call may proceed."""
+    limits = LIMITS.get(endpoint, {})
+    buckets = []
+    if user_id and 'user' in limits:
+        buckets.append(('%s:user:%s' % (endpoint, user_id), limits['user']))
+    if conference_key and 'conference' in limits:
+        buckets.append(('%s:conference:%s' % (endpoint, conference_key),
+                        CONFERENCE_LIMITS.get(conference_key,
+                                              limits['conference'])))
+    for bucket, limit in buckets:
+        if not _take(bucket, limit):
+            logging.warning('throttled %s', bucket)
+            return False
+    return True
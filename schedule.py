@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+"""schedule.py
+
+Overlap detection between sessions, for the wishlist conflict endpoints.
+
+A session runs from its date & startTime for its duration; sessions
+without a start time aren't scheduled and never conflict. Conflicts are
+found by sorting the sessions by start and sweeping over them with a heap
+of the ones still running, so a wishlist costs O(n log n) plus one step
+per conflicting pair instead of a comparison per pair.
+
+"""
+
+import heapq
+from datetime import datetime
+from datetime import timedelta
+
+# sessions without duration still take up their start time
+MIN_DURATION = timedelta(minutes=1)
+
+
+def interval(session):
+    """Return (start, end) of the session, None if it isn't scheduled."""
+    if not (session and session.date and session.startTime):
+        return None
+    start = datetime.combine(session.date, session.startTime)
+    duration = timedelta(minutes=session.duration or 0)
+    return start, start + max(duration, MIN_DURATION)
+
+
+def findConflicts(sessions):
+    """Return a (session, session, overlap) triple per overlapping pair
+       of sessions; the first one starts first, overlap is a timedelta."""
+    timed = []
+    for i, session in enumerate(sessions):
+        times = interval(session)
+        if times:
+            timed.append((times, i))
+    timed.sort()
+
+    running = []  # heap of (end, index) of the sessions started so far
+    conflicts = []
+    for (start, end), i in timed:
+        while running and running[0][0] <= start:
+            heapq.heappop(running)
+        for other_end, j in running:
+            conflicts.append((sessions[j], sessions[i],
+                              min(end, other_end) - start))
+        heapq.heappush(running, (end, i))
+    return conflicts
+
+
+def conflictsWith(session, sessions):
+    """Return the (session, other, overlap) triples of the sessions the
+       session would overlap with."""
+    times = interval(session)
+    if times is None:
+        return []
+    start, end = times
+    conflicts = []
+    for other in sessions:
+        other_times = interval(other)
+        if (other_times and other.key != session.key and
+                other_times[0] < end and start < other_times[1]):
+            conflicts.append((session, other,
+                              min(end, other_times[1]) -
+                              max(start, other_times[0])))
+    return conflicts
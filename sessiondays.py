@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+"""sessiondays.py
+
+Date-bucketed index of the sessions of all conferences, for the
+"happening now" endpoint (getSessionsHappening).
+
+The sessions of a date are spread over SHARDS SessionDay entities by a
+hash of their websafe key, so that session writes across conferences
+don't all contend for one entity group per day. Each shard maps the
+websafe keys of its sessions to their start & end minute of the day
+(None for sessions without a start time). Creating or updating a
+session enqueues /tasks/update_session_day, which moves the session to
+the bucket of its date. The shards of a day are read with one batch get
+and cached merged in memcache, so listing a day's sessions costs one
+memcache read plus a batch get of the sessions in the requested window.
+
+"""
+
+import zlib
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import SessionDay
+
+import schedule
+
+MEMCACHE_SESSION_DAY_TPL = 'SESSION_DAY:%s'
+BUCKET_ID_TPL = '%s:%d'
+# bounds how long a read racing with an update can keep a stale bucket
+SESSION_DAY_TIMEOUT = 600
+# buckets per date; changing it requires rerunning the session_days
+# migration
+SHARDS = 16
+
+
+def _minute(moment):
+    return moment.hour * 60 + moment.minute
+
+
+def entry(session):
+    """Return [start minute, end minute] of the session in its bucket."""
+    times = schedule.interval(session)
+    if times is None:
+        return [None, None]
+    start, end = times
+    # sessions running past midnight end with their day
+    if end.date() > start.date():
+        return [_minute(start), 24 * 60]
+    return [_minute(start), _minute(end)]
+
+
+def _shardId(day, websafe_key):
+    """Return the id of the bucket of the session on the date."""
+    return BUCKET_ID_TPL % (day, zlib.crc32(websafe_key) % SHARDS)
+
+
+def enqueueUpdate(session_key, old_date=None):
+    """Enqueue moving the session to the bucket of its date, within the
+       running transaction if there is one."""
+    params = {'websafeSessionKey': session_key.urlsafe()}
+    if old_date:
+        params['oldDate'] = old_date.isoformat()
+    taskqueue.add(url='/tasks/update_session_day', params=params,
+                  transactional=ndb.in_transaction())
+
+
+@ndb.transactional
+def _updateBucket(bucket_id, add=None, remove=()):
+    """Add {websafe key: entry} to & remove websafe keys from a bucket."""
+    bucket = (SessionDay.get_by_id(bucket_id) or
+              SessionDay(id=bucket_id, sessions={}))
+    sessions = dict(bucket.sessions or {})
+    sessions.update(add or {})
+    for websafe_key in remove:
+        sessions.pop(websafe_key, None)
+    if sessions != bucket.sessions:
+        bucket.sessions = sessions
+        bucket.put()
+
+
+def _invalidate(days):
+    memcache.delete_multi([MEMCACHE_SESSION_DAY_TPL % day for day in days])
+
+
+def updateSession(websafe_key, old_day=None):
+    """Put the session into the bucket of its date, taking it out of the
+       bucket of old_day; used by the update task."""
+    session = ndb.Key(urlsafe=websafe_key).get()
+    day = session.date.isoformat() if session and session.date else None
+    if day:
+        _updateBucket(_shardId(day, websafe_key),
+                      add={websafe_key: entry(session)})
+    if old_day and old_day != day:
+        _updateBucket(_shardId(old_day, websafe_key), remove=[websafe_key])
+    _invalidate(filter(None, [day, old_day]))
+
+
+def addSessions(sessions):
+    """Put the sessions into the buckets of their dates, one transaction
+       per bucket; used by the session_days migration."""
+    buckets = {}
+    days = set()
+    for session in sessions:
+        if session.date:
+            day = session.date.isoformat()
+            websafe_key = session.key.urlsafe()
+            buckets.setdefault(_shardId(day, websafe_key), {})[
+                websafe_key] = entry(session)
+            days.add(day)
+    for bucket_id, entries in buckets.items():
+        _updateBucket(bucket_id, add=entries)
+    _invalidate(days)
+
+
+def getDay(day):
+    """Return {websafe key: [start, end]} of the sessions on the date."""
+    key = MEMCACHE_SESSION_DAY_TPL % day.isoformat()
+    sessions = memcache.get(key)
+    if sessions is None:
+        sessions = {}
+        shards = ndb.get_multi([
+            ndb.Key(SessionDay, BUCKET_ID_TPL % (day.isoformat(), shard))
+            for shard in range(SHARDS)])
+        for bucket in filter(None, shards):
+            sessions.update(bucket.sessions or {})
+        memcache.set(key, sessions, time=SESSION_DAY_TIMEOUT)
+    return sessions
+
+
+def sessionsHappening(day, from_time=None, to_time=None):
+    """Return the websafe keys of the sessions on the date running at
+       some point between from_time & to_time, ordered by start. Without
+       a window, all sessions of the day (unscheduled ones last)."""
+    low = _minute(from_time) if from_time is not None else None
+    high = _minute(to_time) if to_time is not None else None
+    found = []
+    for websafe_key, (start, end) in getDay(day).items():
+        if low is not None or high is not None:
+            if start is None:
+                continue
+            if low is not None and end <= low:
+                continue
+            if high is not None and start > high:
+                continue
+        found.append((start is None, start, websafe_key))
+    return [websafe_key for _, _, websafe_key in sorted(found)]
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+"""sessionquery.py
+
+Planner for the multi-predicate session query (querySessions).
+
+A Criteria holds the parsed predicates: ranges on date, startTime and
+duration, types to include or exclude, and a speaker. `plan` pushes a
+single predicate into the ancestor query of the conference's sessions,
+so every question is served by the one-property ancestor indexes in
+index.yaml. `fetchPage` evaluates all predicates in memory over the query
+results until a page is full. Open ranges don't match sessions without a
+value for the property.
+
+"""
+
+import collections
+
+from models import Session
+
+Criteria = collections.namedtuple(
+    'Criteria', ['fromDate', 'toDate', 'fromTime', 'toTime',
+                 'minDuration', 'maxDuration', 'includeTypes',
+                 'excludeTypes', 'speaker'])
+
+# entities scanned per datastore batch while filling a page
+SCAN_BATCH = 50
+
+
+def _ranges(criteria):
+    """Return (property, low, high) of the ranges, bounds inclusive."""
+    return [('date', criteria.fromDate, criteria.toDate),
+            ('startTime', criteria.fromTime, criteria.toTime),
+            ('duration', criteria.minDuration, criteria.maxDuration)]
+
+
+def matches(session, criteria):
+    """Return True if the session satisfies all predicates."""
+    if criteria.speaker and session.speaker != criteria.speaker:
+        return False
+    if criteria.includeTypes and session.type not in criteria.includeTypes:
+        return False
+    if session.type in criteria.excludeTypes:
+        return False
+    for name, low, high in _ranges(criteria):
+        if low is None and high is None:
+            continue
+        value = getattr(session, name)
+        if value is None:
+            return False
+        if low is not None and value < low:
+            return False
+        if high is not None and value > high:
+            return False
+    return True
+
+
+def plan(ancestor, criteria):
+    """Return the query of the conference sessions for the criteria.
+
+    Equalities narrow the most (a speaker, a single type, a single day),
+    then the ranges; a session list is spread over a few days, so a date
+    range is taken before a time range, and durations cluster on a few
+    values, so they come last. Exclusions are never pushed: != scans
+    nearly everything and can't be combined with another inequality.
+    """
+    query = Session.query(ancestor=ancestor)
+    if criteria.speaker:
+        return query.filter(Session.speaker == criteria.speaker)
+    if len(criteria.includeTypes) == 1:
+        return query.filter(Session.type == criteria.includeTypes[0])
+    for name, low, high in _ranges(criteria):
+        prop = getattr(Session, name)
+        if low is not None and low == high:
+            return query.filter(prop == low)
+        if low is not None:
+            query = query.filter(prop >= low)
+        if high is not None:
+            query = query.filter(prop <= high)
+        if low is not None or high is not None:
+            return query.order(prop)
+    return query
+
+
+def fetchPage(query, criteria, limit, cursor=None):
+    """Return (sessions, next cursor or None) for a page of up to limit
+       sessions of the query that match the criteria."""
+    it = query.iter(start_cursor=cursor, produce_cursors=True,
+                    batch_size=max(limit, SCAN_BATCH))
+    sessions = []
+    for session in it:
+        if matches(session, criteria):
+            sessions.append(session)
+            if len(sessions) == limit:
+                break
+    if len(sessions) == limit and it.has_next():
+        return sessions, it.cursor_after()
+    return sessions, None
@@ -33,7 +33,8 @@ var app = angular.module('conferenceApp',
                     controller: 'MyProfileCtrl'
                 }).
                 when('/', {
-                    templateUrl: '/partials/home.html'
+                    templateUrl: '/partials/home.html',
+                    controller: 'HomeCtrl'
                 }).
                 otherwise({
                     redirectTo: '/'
@@ -130,3 +131,69 @@ app.factory('oauth2Provider', function ($modal) {
 
     return oauth2Provider;
 });
+
+
+/**
+ * @ngdoc service
+ * @name apiCache
+ *
+ * @description
+ * Client side cache of the conference API responses, keyed by method and parameters.
+ * The server sets a change token on the cacheable responses; a new token means that
+ * the user's profile or any conference or session has changed, so all cached
+ * responses are dropped. Entries also expire after TTL.
+ *
+ */
+app.factory('apiCache', function () {
+    var apiCache = {
+        TTL: 5 * 60 * 1000,
+        changeToken: null,
+        entries: {}
+    };
+
+    /**
+     * Invokes the conference API method, or returns its cached response.
+     * The callback is always called asynchronously, like gapi does.
+     *
+     * @param {string} method the name of the conference API method.
+     * @param {Object} params the request parameters.
+     * @param {Function} callback called with the response.
+     */
+    apiCache.execute = function (method, params, callback) {
+        var key = method + ':' + JSON.stringify(params || {});
+        var entry = apiCache.entries[key];
+        if (entry && new Date().getTime() - entry.time < apiCache.TTL) {
+            setTimeout(function () {
+                callback(entry.resp);
+            }, 0);
+            return;
+        }
+        gapi.client.conference[method](params || {}).execute(function (resp) {
+            if (!resp.error) {
+                apiCache.setChangeToken(resp.result && resp.result.changeToken);
+                apiCache.entries[key] = {resp: resp, time: new Date().getTime()};
+            }
+            callback(resp);
+        });
+    };
+
+    /**
+     * Drops all cached responses if the token differs from the last one seen.
+     */
+    apiCache.setChangeToken = function (token) {
+        if (token && token !== apiCache.changeToken) {
+            apiCache.entries = {};
+            apiCache.changeToken = token;
+        }
+    };
+
+    /**
+     * Drops all cached responses; called after the client changed data itself
+     * and when the user signs in or out.
+     */
+    apiCache.invalidate = function () {
+        apiCache.entries = {};
+    };
+
+    return apiCache;
+});
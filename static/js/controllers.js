@@ -17,6 +17,149 @@ var conferenceApp = conferenceApp || {};
  */
 conferenceApp.controllers = angular.module('conferenceControllers', ['ui.bootstrap']);
 
+/**
+ * Decodes the compact (columnar) encoding of a ConferenceForms/SessionForms list, see compact.py.
+ *
+ * @param compact the compact field of the response.
+ * @returns {Array} the items, as the list endpoints return them without compact.
+ */
+conferenceApp.decodeCompact = function (compact) {
+    var NULL = -1;
+    var MS_PER_DAY = 24 * 60 * 60 * 1000;
+    var dictionary = compact.dictionary || [];
+    var items = [];
+    var i;
+    for (i = 0; i < (compact.count || 0); i++) {
+        items.push({});
+    }
+
+    var pad = function (n) {
+        return (n < 10 ? '0' : '') + n;
+    };
+
+    var decoders = {
+        string: function (column, i) {
+            // values lists the items without the field, which the non compact
+            // lists leave out
+            return (column.values || []).indexOf(i) === -1 ? column.strings[i] : undefined;
+        },
+        dict: function (column, i) {
+            return column.values[i] === NULL ? undefined : dictionary[column.values[i]];
+        },
+        int: function (column, i) {
+            return column.values[i] === NULL ? undefined : column.values[i];
+        },
+        date: function (column, i) {
+            // 'YYYY-MM-DD', as the non compact lists send dates
+            return column.values[i] === NULL ? undefined :
+                new Date(column.values[i] * MS_PER_DAY).toISOString().substring(0, 10);
+        },
+        time: function (column, i) {
+            // 'HH:MM:SS', as the non compact lists send times
+            var minutes = column.values[i];
+            return minutes === NULL ? undefined :
+                pad(Math.floor(minutes / 60)) + ':' + pad(minutes % 60) + ':00';
+        }
+    };
+
+    angular.forEach(compact.columns || [], function (column) {
+        var i, j, offset = 0;
+        if (column.encoding === 'list') {
+            for (i = 0; i < items.length; i++) {
+                var values = [];
+                for (j = 0; j < column.lengths[i]; j++) {
+                    values.push(dictionary[column.values[offset + j]]);
+                }
+                offset += column.lengths[i];
+                if (values.length) {
+                    items[i][column.field] = values;
+                }
+            }
+            return;
+        }
+        var decode = decoders[column.encoding];
+        for (i = 0; i < items.length; i++) {
+            var value = decode(column, i);
+            if (value !== undefined) {
+                items[i][column.field] = value;
+            }
+        }
+    });
+    return items;
+};
+
+/**
+ * Returns the items of a ConferenceForms/SessionForms response, decoding them if compact.
+ *
+ * @param resp the response of a list endpoint.
+ * @returns {Array} the items.
+ */
+conferenceApp.listItems = function (resp) {
+    return resp.compact ? conferenceApp.decodeCompact(resp.compact) : resp.items || [];
+};
+
+/**
+ * @ngdoc controller
+ * @name HomeCtrl
+ *
+ * @description
+ * A controller used for the home page.
+ */
+conferenceApp.controllers.controller('HomeCtrl', function ($scope, $log, oauth2Provider, apiCache) {
+
+    /**
+     * Holds the upcoming conferences, sorted by start date.
+     * @type {Array}
+     */
+    $scope.upcomingConferences = [];
+
+    /**
+     * Holds the dashboard of the signed in user.
+     * @type {{}}
+     */
+    $scope.dashboard = {};
+
+    /**
+     * Invokes the conference.getDashboard method if the user is signed in, which returns
+     * the upcoming conferences together with the user's data in one call.
+     * Otherwise invokes the conference.getUpcomingConferences method (served from memcache).
+     */
+    $scope.init = function () {
+        if (oauth2Provider.signedIn) {
+            apiCache.execute('getDashboard', {}, function (resp) {
+                $scope.$apply(function () {
+                    if (resp.error) {
+                        $log.error('Failed to get the dashboard : ' + (resp.error.message || ''));
+                    } else {
+                        $scope.dashboard = resp.result;
+                        $scope.upcomingConferences = resp.result.upcomingConferences || [];
+                    }
+                });
+            });
+            return;
+        }
+        apiCache.execute('getUpcomingConferences', {}, function (resp) {
+            $scope.$apply(function () {
+                if (resp.error) {
+                    $log.error('Failed to get the upcoming conferences : ' + (resp.error.message || ''));
+                } else {
+                    $scope.upcomingConferences = resp.result.items || [];
+                }
+            });
+        });
+    };
+
+    // Reload once the user has signed in (or out).
+    $scope.$watch(function () {
+        return oauth2Provider.signedIn;
+    }, function (signedIn, wasSignedIn) {
+        if (signedIn !== wasSignedIn) {
+            $scope.dashboard = {};
+            $scope.init();
+        }
+    });
+});
+
 /**
  * @ngdoc controller
  * @name MyProfileCtrl
@@ -25,7 +168,7 @@ conferenceApp.controllers = angular.module('conferenceControllers', ['ui.bootstr
  * A controller used for the My Profile page.
  */
 conferenceApp.controllers.controller('MyProfileCtrl',
-    function ($scope, $log, oauth2Provider, HTTP_ERRORS) {
+    function ($scope, $log, oauth2Provider, apiCache, HTTP_ERRORS) {
         $scope.submitted = false;
         $scope.loading = false;
 
@@ -55,29 +198,45 @@ conferenceApp.controllers.controller('MyProfileCtrl',
             {'size': 'XXXL_M', 'text': "XXXL - Men's"},
             {'size': 'XXXL_W', 'text': "XXXL - Women's"}
         ];
+        /**
+         * The conferences the user attends and the sessions in the wishlist.
+         * @type {Array}
+         */
+        $scope.conferencesToAttend = [];
+        $scope.wishlistSessions = [];
+
+        /**
+         * The url of the user's iCalendar feed, once requested.
+         * @type {string}
+         */
+        $scope.calendarFeedUrl = '';
+
         /**
          * Initializes the My profile page.
          * Update the profile if the user's profile has been stored.
+         * Invokes the conference.getDashboard method, which returns the profile together with
+         * the attended conferences and the wishlist in one call.
          */
         $scope.init = function () {
             var retrieveProfileCallback = function () {
                 $scope.profile = {};
                 $scope.loading = true;
-                gapi.client.conference.getProfile().
-                    execute(function (resp) {
-                        $scope.$apply(function () {
-                            $scope.loading = false;
-                            if (resp.error) {
-                                // Failed to get a user profile.
-                            } else {
-                                // Succeeded to get the user profile.
-                                $scope.profile.displayName = resp.result.displayName;
-                                $scope.profile.teeShirtSize = resp.result.teeShirtSize;
-                                $scope.initialProfile = resp.result;
-                            }
-                        });
-                    }
-                );
+                apiCache.execute('getDashboard', {}, function (resp) {
+                    $scope.$apply(function () {
+                        $scope.loading = false;
+                        if (resp.error) {
+                            // Failed to get a user profile.
+                        } else {
+                            // Succeeded to get the user profile.
+                            var profile = resp.result.profile;
+                            $scope.profile.displayName = profile.displayName;
+                            $scope.profile.teeShirtSize = profile.teeShirtSize;
+                            $scope.initialProfile = profile;
+                            $scope.conferencesToAttend = resp.result.conferencesToAttend || [];
+                            $scope.wishlistSessions = resp.result.wishlistSessions || [];
+                        }
+                    });
+                });
             };
             if (!oauth2Provider.signedIn) {
                 var modalInstance = oauth2Provider.showLoginModal();
@@ -111,6 +270,7 @@ conferenceApp.controllers.controller('MyProfileCtrl',
                             }
                         } else {
                             // The request has succeeded.
+                            apiCache.invalidate();
                             $scope.messages = 'The profile has been updated';
                             $scope.alertStatus = 'success';
                             $scope.submitted = false;
@@ -124,6 +284,33 @@ conferenceApp.controllers.controller('MyProfileCtrl',
                     });
                 });
         };
+
+        /**
+         * Invokes the conference.getCalendarFeed API, or conference.resetCalendarFeed to replace the url.
+         *
+         * @param reset true to replace the feed url with a new one.
+         */
+        $scope.getCalendarFeed = function (reset) {
+            var method = reset ? 'resetCalendarFeed' : 'getCalendarFeed';
+            $scope.loading = true;
+            gapi.client.conference[method]().execute(function (resp) {
+                $scope.$apply(function () {
+                    $scope.loading = false;
+                    if (resp.error) {
+                        var errorMessage = resp.error.message || '';
+                        $scope.messages = 'Failed to get the calendar feed : ' + errorMessage;
+                        $scope.alertStatus = 'warning';
+                        $log.error($scope.messages);
+                        if (resp.code && resp.code == HTTP_ERRORS.UNAUTHORIZED) {
+                            oauth2Provider.showLoginModal();
+                        }
+                    } else {
+                        $scope.calendarFeedUrl = window.location.protocol + '//' +
+                            window.location.host + resp.result.data;
+                    }
+                });
+            });
+        };
     })
 ;
 
@@ -135,7 +322,7 @@ conferenceApp.controllers.controller('MyProfileCtrl',
  * A controller used for the Create conferences page.
  */
 conferenceApp.controllers.controller('CreateConferenceCtrl',
-    function ($scope, $log, oauth2Provider, HTTP_ERRORS) {
+    function ($scope, $log, oauth2Provider, apiCache, HTTP_ERRORS) {
 
         /**
          * The conference object being edited in the page.
@@ -231,6 +418,7 @@ conferenceApp.controllers.controller('CreateConferenceCtrl',
                             }
                         } else {
                             // The request has succeeded.
+                            apiCache.invalidate();
                             $scope.messages = 'The conference has been created : ' + resp.result.name;
                             $scope.alertStatus = 'success';
                             $scope.submitted = false;
@@ -249,7 +437,7 @@ conferenceApp.controllers.controller('CreateConferenceCtrl',
  * @description
  * A controller used for the Show conferences page.
  */
-conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $log, oauth2Provider, HTTP_ERRORS) {
+conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $log, oauth2Provider, apiCache, HTTP_ERRORS) {
 
     /**
      * Holds the status if the query is being executed.
@@ -293,6 +481,13 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
      */
     $scope.conferences = [];
 
+    /**
+     * Holds the number of conferences per facet value for the current filters,
+     * e.g. [{facet: 'CITY', displayName: 'City', values: [{value: 'London', count: 3}]}].
+     * @type {Array}
+     */
+    $scope.facets = [];
+
     /**
      * Holds the state if offcanvas is enabled.
      *
@@ -423,12 +618,59 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
         }
     };
 
+    /**
+     * Invokes the conference.getConferenceFacets API with the filters sent to queryConferences.
+     *
+     * @param sendFilters the filters in the format of the queryConferences request.
+     */
+    $scope.getConferenceFacets = function (sendFilters) {
+        apiCache.execute('getConferenceFacets', sendFilters, function (resp) {
+            $scope.$apply(function () {
+                $scope.facets = [];
+                if (resp.error) {
+                    // e.g. filters the facet counters can't answer
+                    $log.error('Failed to get the conference facets : ' + (resp.error.message || ''));
+                    return;
+                }
+                angular.forEach($scope.filtereableFields, function (field) {
+                    var facet = {facet: field.enumValue, displayName: field.displayName, values: []};
+                    angular.forEach(resp.result.items, function (item) {
+                        if (item.facet == field.enumValue) {
+                            facet.values.push({value: item.value, count: item.count});
+                        }
+                    });
+                    $scope.facets.push(facet);
+                });
+            });
+        });
+    };
+
+    /**
+     * Adds an equality filter for the facet value and queries the conferences.
+     *
+     * @param facet the facet (filterable field enum value).
+     * @param value the facet value.
+     */
+    $scope.addFacetFilter = function (facet, value) {
+        for (var i = 0; i < $scope.filtereableFields.length; i++) {
+            if ($scope.filtereableFields[i].enumValue == facet) {
+                $scope.filters.push({
+                    field: $scope.filtereableFields[i],
+                    operator: $scope.operators[0],
+                    value: value
+                });
+            }
+        }
+        $scope.queryConferences();
+    };
+
     /**
      * Invokes the conference.queryConferences API.
      */
     $scope.queryConferencesAll = function () {
         var sendFilters = {
-            filters: []
+            filters: [],
+            compact: true
         }
         for (var i = 0; i < $scope.filters.length; i++) {
             var filter = $scope.filters[i];
@@ -441,31 +683,28 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
             }
         }
         $scope.loading = true;
-        gapi.client.conference.queryConferences(sendFilters).
-            execute(function (resp) {
-                $scope.$apply(function () {
-                    $scope.loading = false;
-                    if (resp.error) {
-                        // The request has failed.
-                        var errorMessage = resp.error.message || '';
-                        $scope.messages = 'Failed to query conferences : ' + errorMessage;
-                        $scope.alertStatus = 'warning';
-                        $log.error($scope.messages + ' filters : ' + JSON.stringify(sendFilters));
-                    } else {
-                        // The request has succeeded.
-                        $scope.submitted = false;
-                        $scope.messages = 'Query succeeded : ' + JSON.stringify(sendFilters);
-                        $scope.alertStatus = 'success';
-                        $log.info($scope.messages);
+        $scope.getConferenceFacets(sendFilters);
+        apiCache.execute('queryConferences', sendFilters, function (resp) {
+            $scope.$apply(function () {
+                $scope.loading = false;
+                if (resp.error) {
+                    // The request has failed.
+                    var errorMessage = resp.error.message || '';
+                    $scope.messages = 'Failed to query conferences : ' + errorMessage;
+                    $scope.alertStatus = 'warning';
+                    $log.error($scope.messages + ' filters : ' + JSON.stringify(sendFilters));
+                } else {
+                    // The request has succeeded.
+                    $scope.submitted = false;
+                    $scope.messages = 'Query succeeded : ' + JSON.stringify(sendFilters.filters);
+                    $scope.alertStatus = 'success';
+                    $log.info($scope.messages);
 
-                        $scope.conferences = [];
-                        angular.forEach(resp.items, function (conference) {
-                            $scope.conferences.push(conference);
-                        });
-                    }
-                    $scope.submitted = true;
-                });
+                    $scope.conferences = conferenceApp.listItems(resp);
+                }
+                $scope.submitted = true;
             });
+        });
     }
 
     /**
@@ -473,36 +712,32 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
      */
     $scope.getConferencesCreated = function () {
         $scope.loading = true;
-        gapi.client.conference.getConferencesCreated().
-            execute(function (resp) {
-                $scope.$apply(function () {
-                    $scope.loading = false;
-                    if (resp.error) {
-                        // The request has failed.
-                        var errorMessage = resp.error.message || '';
-                        $scope.messages = 'Failed to query the conferences created : ' + errorMessage;
-                        $scope.alertStatus = 'warning';
-                        $log.error($scope.messages);
-
-                        if (resp.code && resp.code == HTTP_ERRORS.UNAUTHORIZED) {
-                            oauth2Provider.showLoginModal();
-                            return;
-                        }
-                    } else {
-                        // The request has succeeded.
-                        $scope.submitted = false;
-                        $scope.messages = 'Query succeeded : Conferences you have created';
-                        $scope.alertStatus = 'success';
-                        $log.info($scope.messages);
+        apiCache.execute('getConferencesCreated', {compact: true}, function (resp) {
+            $scope.$apply(function () {
+                $scope.loading = false;
+                if (resp.error) {
+                    // The request has failed.
+                    var errorMessage = resp.error.message || '';
+                    $scope.messages = 'Failed to query the conferences created : ' + errorMessage;
+                    $scope.alertStatus = 'warning';
+                    $log.error($scope.messages);
 
-                        $scope.conferences = [];
-                        angular.forEach(resp.items, function (conference) {
-                            $scope.conferences.push(conference);
-                        });
+                    if (resp.code && resp.code == HTTP_ERRORS.UNAUTHORIZED) {
+                        oauth2Provider.showLoginModal();
+                        return;
                     }
-                    $scope.submitted = true;
-                });
+                } else {
+                    // The request has succeeded.
+                    $scope.submitted = false;
+                    $scope.messages = 'Query succeeded : Conferences you have created';
+                    $scope.alertStatus = 'success';
+                    $log.info($scope.messages);
+
+                    $scope.conferences = conferenceApp.listItems(resp);
+                }
+                $scope.submitted = true;
             });
+        });
     };
 
     /**
@@ -511,31 +746,30 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
      */
     $scope.getConferencesAttend = function () {
         $scope.loading = true;
-        gapi.client.conference.getConferencesToAttend().
-            execute(function (resp) {
-                $scope.$apply(function () {
-                    if (resp.error) {
-                        // The request has failed.
-                        var errorMessage = resp.error.message || '';
-                        $scope.messages = 'Failed to query the conferences to attend : ' + errorMessage;
-                        $scope.alertStatus = 'warning';
-                        $log.error($scope.messages);
+        apiCache.execute('getConferencesToAttend', {}, function (resp) {
+            $scope.$apply(function () {
+                if (resp.error) {
+                    // The request has failed.
+                    var errorMessage = resp.error.message || '';
+                    $scope.messages = 'Failed to query the conferences to attend : ' + errorMessage;
+                    $scope.alertStatus = 'warning';
+                    $log.error($scope.messages);
 
-                        if (resp.code && resp.code == HTTP_ERRORS.UNAUTHORIZED) {
-                            oauth2Provider.showLoginModal();
-                            return;
-                        }
-                    } else {
-                        // The request has succeeded.
-                        $scope.conferences = resp.result.items;
-                        $scope.loading = false;
-                        $scope.messages = 'Query succeeded : Conferences you will attend (or you have attended)';
-                        $scope.alertStatus = 'success';
-                        $log.info($scope.messages);
+                    if (resp.code && resp.code == HTTP_ERRORS.UNAUTHORIZED) {
+                        oauth2Provider.showLoginModal();
+                        return;
                     }
-                    $scope.submitted = true;
-                });
+                } else {
+                    // The request has succeeded.
+                    $scope.conferences = resp.result.items;
+                    $scope.loading = false;
+                    $scope.messages = 'Query succeeded : Conferences you will attend (or you have attended)';
+                    $scope.alertStatus = 'success';
+                    $log.info($scope.messages);
+                }
+                $scope.submitted = true;
             });
+        });
     };
 });
 
@@ -547,7 +781,7 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
  * @description
  * A controller used for the conference detail page.
  */
-conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $log, $routeParams, HTTP_ERRORS) {
+conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $log, $routeParams, apiCache, HTTP_ERRORS) {
     $scope.conference = {};
 
     $scope.isUserAttending = false;
@@ -581,7 +815,7 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
 
         $scope.loading = true;
         // If the user is attending the conference, updates the status message and available function.
-        gapi.client.conference.getProfile().execute(function (resp) {
+        apiCache.execute('getProfile', {}, function (resp) {
             $scope.$apply(function () {
                 $scope.loading = false;
                 if (resp.error) {
@@ -626,6 +860,7 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
                 } else {
                     if (resp.result) {
                         // Register succeeded.
+                        apiCache.invalidate();
                         $scope.messages = 'Registered for the conference';
                         $scope.alertStatus = 'success';
                         $scope.isUserAttending = true;
@@ -662,6 +897,7 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
                 } else {
                     if (resp.result) {
                         // Unregister succeeded.
+                        apiCache.invalidate();
                         $scope.messages = 'Unregistered from the conference';
                         $scope.alertStatus = 'success';
                         $scope.conference.seatsAvailable = $scope.conference.seatsAvailable + 1;
@@ -691,7 +927,7 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
  * such as user authentications.
  *
  */
-conferenceApp.controllers.controller('RootCtrl', function ($scope, $location, oauth2Provider) {
+conferenceApp.controllers.controller('RootCtrl', function ($scope, $location, oauth2Provider, apiCache) {
 
     /**
      * Returns if the viewLocation is the currently viewed page.
@@ -720,6 +956,7 @@ conferenceApp.controllers.controller('RootCtrl', function ($scope, $location, oa
             gapi.client.oauth2.userinfo.get().execute(function (resp) {
                 $scope.$apply(function () {
                     if (resp.email) {
+                        apiCache.invalidate();
                         oauth2Provider.signedIn = true;
                         $scope.alertStatus = 'success';
                         $scope.rootMessages = 'Logged in with ' + resp.email;
@@ -740,6 +977,7 @@ conferenceApp.controllers.controller('RootCtrl', function ($scope, $location, oa
                 jQuery('#signInButton button').attr('disabled', 'true').css('cursor', 'default');
                 if (gapi.auth.getToken() && gapi.auth.getToken().access_token) {
                     $scope.$apply(function () {
+                        apiCache.invalidate();
                         oauth2Provider.signedIn = true;
                     });
                 }
@@ -755,6 +993,7 @@ conferenceApp.controllers.controller('RootCtrl', function ($scope, $location, oa
      */
     $scope.signOut = function () {
         oauth2Provider.signOut();
+        apiCache.invalidate();
         $scope.alertStatus = 'success';
         $scope.rootMessages = 'Logged out';
     };
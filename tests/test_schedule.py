@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+"""test_schedule.py
+
+Overlap output of the wishlist conflict sweep (schedule.py).
+
+    $ APPENGINE_SDK=/path/to/google_appengine \
+          python -m unittest discover -s tests -t .
+
+"""
+
+import random
+import unittest
+from datetime import date
+from datetime import time
+from datetime import timedelta
+
+import localenv
+
+localenv.fixSysPath()
+
+from google.appengine.ext import ndb  # noqa
+
+from models import Session  # noqa
+
+import schedule  # noqa
+
+DAY = date(2026, 5, 4)
+
+
+class ScheduleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.env = localenv.LocalEnvironment().activate()
+        self.conf_key = ndb.Key('Conference', 1)
+        self.ids = 0
+
+    def tearDown(self):
+        self.env.deactivate()
+
+    def session(self, start, duration=None, day=DAY):
+        """Return a Session starting at `start` ('HH:MM' or None)."""
+        self.ids += 1
+        hour, minute = map(int, start.split(':')) if start else (0, 0)
+        return Session(key=ndb.Key(Session, self.ids, parent=self.conf_key),
+                       name='Session %d' % self.ids, date=day,
+                       startTime=time(hour, minute) if start else None,
+                       duration=duration)
+
+    def overlaps(self, sessions):
+        """Return {(first id, second id): overlap minutes}."""
+        return dict(((first.key.id(), second.key.id()),
+                     overlap.total_seconds() / 60)
+                    for first, second, overlap in
+                    schedule.findConflicts(sessions))
+
+    def testOverlap(self):
+        first = self.session('10:00', 60)
+        second = self.session('10:30', 60)
+        self.assertEqual(self.overlaps([second, first]), {(1, 2): 30})
+
+    def testContained(self):
+        outer = self.session('09:00', 180)
+        inner = self.session('10:00', 30)
+        self.assertEqual(self.overlaps([outer, inner]), {(1, 2): 30})
+
+    def testBoundary(self):
+        # a session ending when the next one starts doesn't overlap it
+        first = self.session('10:00', 60)
+        second = self.session('11:00', 60)
+        self.assertEqual(self.overlaps([first, second]), {})
+        third = self.session('10:59', 30)
+        self.assertEqual(self.overlaps([first, second, third]),
+                         {(1, 3): 1, (3, 2): 29})
+
+    def testMissingValues(self):
+        # unscheduled sessions never conflict
+        scheduled = self.session('10:00', 60)
+        no_time = self.session(None, 60)
+        no_date = self.session('10:00', 60, day=None)
+        self.assertEqual(self.overlaps([scheduled, no_time, no_date]), {})
+        self.assertEqual(schedule.conflictsWith(no_time, [scheduled]), [])
+        # sessions without duration take up their start minute
+        first = self.session('10:30')
+        second = self.session('10:30', 0)
+        self.assertEqual(self.overlaps([scheduled, first, second]),
+                         {(1, 4): 1, (1, 5): 1, (4, 5): 1})
+
+    def testOverMidnight(self):
+        late = self.session('23:30', 60)
+        early = self.session('00:00', 45, day=DAY + timedelta(days=1))
+        other_day = self.session('00:00', 45)
+        self.assertEqual(self.overlaps([early, late, other_day]),
+                         {(1, 2): 30})
+
+    def testSameAsPairwise(self):
+        rng = random.Random(0)
+        sessions = [self.session('%02d:%02d' % (rng.randint(8, 23),
+                                                rng.choice([0, 15, 30, 45])),
+                                 rng.choice([None, 15, 30, 60, 120]),
+                                 DAY + timedelta(days=rng.randint(0, 1)))
+                    for _ in range(100)]
+        pairwise = {}
+        for session in sessions:
+            for _, other, overlap in schedule.conflictsWith(session,
+                                                            sessions):
+                pair = tuple(sorted([session.key.id(), other.key.id()]))
+                pairwise[pair] = overlap.total_seconds() / 60
+        found = dict((tuple(sorted(pair)), overlap) for pair, overlap in
+                     self.overlaps(sessions).items())
+        self.assertEqual(found, pairwise)
+
+
+if __name__ == '__main__':
+    unittest.main()
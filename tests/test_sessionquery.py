@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+"""test_sessionquery.py
+
+Predicate choice of the querySessions planner and the in-memory
+evaluation of the other predicates (sessionquery.py).
+
+    $ APPENGINE_SDK=/path/to/google_appengine \
+          python -m unittest discover -s tests -t .
+
+"""
+
+import unittest
+from datetime import date
+from datetime import time
+
+import localenv
+
+localenv.fixSysPath()
+
+from google.appengine.ext import ndb  # noqa
+
+from models import Session  # noqa
+
+import sessionquery  # noqa
+
+DAY = date(2026, 5, 4)
+NEXT_DAY = date(2026, 5, 5)
+
+
+def criteria(**predicates):
+    values = dict((field, None) for field in sessionquery.Criteria._fields)
+    values.update(includeTypes=[], excludeTypes=[])
+    values.update(predicates)
+    return sessionquery.Criteria(**values)
+
+
+class PlanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.env = localenv.LocalEnvironment().activate()
+        self.conf_key = ndb.Key('Conference', 1)
+
+    def tearDown(self):
+        self.env.deactivate()
+
+    def assertPlan(self, predicates, filters=None, order=None):
+        query = sessionquery.plan(self.conf_key, criteria(**predicates))
+        self.assertEqual(query.ancestor, self.conf_key)
+        self.assertEqual(query.filters, filters)
+        expected = Session.query()
+        if order is not None:
+            expected = expected.order(order)
+        self.assertEqual(query.orders, expected.orders)
+
+    def testSpeakerFirst(self):
+        self.assertPlan(
+            dict(speaker='Ada', includeTypes=['talk'], fromDate=DAY),
+            Session.speaker == 'Ada')
+
+    def testSingleTypeBeforeRanges(self):
+        self.assertPlan(dict(includeTypes=['talk'], fromDate=DAY,
+                             toTime=time(19, 0)),
+                        Session.type == 'talk')
+
+    def testSeveralTypesNotPushed(self):
+        self.assertPlan(dict(includeTypes=['talk', 'panel'],
+                             minDuration=30),
+                        Session.duration >= 30, Session.duration)
+
+    def testExclusionsNotPushed(self):
+        self.assertPlan(dict(excludeTypes=['workshop']))
+        self.assertPlan(dict(excludeTypes=['workshop'], toTime=time(19, 0)),
+                        Session.startTime <= time(19, 0), Session.startTime)
+
+    def testSingleDayIsEquality(self):
+        self.assertPlan(dict(fromDate=DAY, toDate=DAY, fromTime=time(9, 0)),
+                        Session.date == DAY)
+
+    def testDateRangeBeforeTimeRange(self):
+        self.assertPlan(dict(fromDate=DAY, toDate=NEXT_DAY,
+                             fromTime=time(9, 0), maxDuration=60),
+                        ndb.AND(Session.date >= DAY,
+                                Session.date <= NEXT_DAY),
+                        Session.date)
+
+    def testOpenRanges(self):
+        self.assertPlan(dict(fromDate=DAY), Session.date >= DAY,
+                        Session.date)
+        self.assertPlan(dict(toTime=time(19, 0), minDuration=30),
+                        Session.startTime <= time(19, 0), Session.startTime)
+        self.assertPlan(dict(maxDuration=60), Session.duration <= 60,
+                        Session.duration)
+
+    def testNoPredicates(self):
+        self.assertPlan({})
+
+
+class FetchPageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.env = localenv.LocalEnvironment().activate()
+        ndb.get_context().clear_cache()
+        self.conf_key = ndb.Key('Conference', 1)
+        self.keys = ndb.put_multi([
+            Session(parent=self.conf_key, name='keynote', type='keynote',
+                    date=DAY, startTime=time(9, 0), duration=60),
+            Session(parent=self.conf_key, name='workshop', type='workshop',
+                    date=DAY, startTime=time(10, 0), duration=120),
+            Session(parent=self.conf_key, name='late talk', type='talk',
+                    date=DAY, startTime=time(19, 30), duration=30),
+            Session(parent=self.conf_key, name='unscheduled', type='talk'),
+            Session(parent=self.conf_key, name='next day', type='talk',
+                    date=NEXT_DAY, startTime=time(11, 0)),
+        ])
+
+    def tearDown(self):
+        self.env.deactivate()
+
+    def names(self, limit=10, cursor=None, **predicates):
+        query_criteria = criteria(**predicates)
+        query = sessionquery.plan(self.conf_key, query_criteria)
+        sessions, next_cursor = sessionquery.fetchPage(
+            query, query_criteria, limit, cursor)
+        return sorted(session.name for session in sessions), next_cursor
+
+    def testNonWorkshopsBefore7pm(self):
+        names, _ = self.names(excludeTypes=['workshop'], toTime=time(19, 0))
+        self.assertEqual(names, ['keynote', 'next day'])
+
+    def testMissingValuesDontMatchRanges(self):
+        names, _ = self.names(minDuration=30)
+        self.assertEqual(names, ['keynote', 'late talk', 'workshop'])
+        names, _ = self.names(includeTypes=['talk'])
+        self.assertEqual(names, ['late talk', 'next day', 'unscheduled'])
+
+    def testPages(self):
+        first, cursor = self.names(limit=2, toDate=NEXT_DAY)
+        self.assertEqual(len(first), 2)
+        self.assertIsNotNone(cursor)
+        rest, cursor = self.names(limit=2, cursor=cursor, toDate=NEXT_DAY)
+        self.assertEqual(len(rest), 2)
+        self.assertEqual(
+            sorted(first + rest),
+            ['keynote', 'late talk', 'next day', 'workshop'])
+        _, cursor = self.names(limit=4, toDate=NEXT_DAY)
+        self.assertIsNone(cursor)
+
+
+if __name__ == '__main__':
+    unittest.main()
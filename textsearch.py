@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+"""textsearch.py
+
+Token based inverted index over Conference and Session entities.
+
+Every indexed entity is split into tokens per field; each token carries
+the weight of the field it was found in. A small SearchPosting entity per
+(kind, token, entity) holds the weight, and a SearchDocument per entity
+remembers which tokens were indexed so that updates only touch postings
+that actually changed. A search queries the postings of each token, best
+weight first and at most MAX_POSTINGS of them, so neither indexing nor
+searching ever reads or writes a list of all entities with a token.
+
+Indexing runs in the /tasks/index_document task, enqueued whenever a
+conference or session is created or updated. Archived conferences are
+taken out of the index.
+
+"""
+
+import re
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import SearchDocument
+from models import SearchPosting
+
+# kind -> ((field, weight), ...)
+INDEXED_FIELDS = {
+    'Conference': (('name', 3), ('topics', 2), ('description', 1)),
+    'Session': (('name', 3), ('speaker', 2), ('highlights', 2)),
+}
+
+STOPWORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'is', 'it', 'of', 'on', 'or', 'the', 'to', 'with'])
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# postings read per query token
+MAX_POSTINGS = 1000
+
+
+def tokenize(text):
+    """Return the list of normalized tokens in text."""
+    return [token for token in TOKEN_RE.findall((text or u'').lower())
+            if len(token) > 1 and token not in STOPWORDS]
+
+
+def tokenWeights(entity):
+    """Return {token: weight} for an entity of an indexed kind."""
+    weights = {}
+    for field, weight in INDEXED_FIELDS[entity.key.kind()]:
+        value = getattr(entity, field)
+        if not isinstance(value, list):
+            value = [value]
+        for text in value:
+            for token in tokenize(text):
+                weights[token] = weights.get(token, 0) + weight
+    return weights
+
+
+def enqueueIndexing(key):
+    """Enqueue (re)indexing of the entity, within the running
+    transaction if there is one."""
+    taskqueue.add(url='/tasks/index_document',
+                  params={'websafeKey': key.urlsafe()},
+                  transactional=ndb.in_transaction())
+
+
+def _postingToken(kind, token):
+    return '%s:%s' % (kind, token)
+
+
+def _postingKey(kind, token, doc):
+    return ndb.Key(SearchPosting, '%s:%s' % (_postingToken(kind, token), doc))
+
+
+def _postingDoc(key):
+    """Return the websafe key of the entity of a posting key."""
+    return key.id().split(':', 2)[2]
+
+
+def indexDocument(websafeKey):
+    """Bring the postings of one entity up to date."""
+    key = ndb.Key(urlsafe=websafeKey)
+    kind = key.kind()
+    entity = key.get()
+    if entity is None or getattr(entity, 'archived', False):
+        new = {}
+    else:
+        new = tokenWeights(entity)
+    document = SearchDocument.get_by_id(websafeKey)
+    old = document.tokens if document else {}
+
+    # every posting has its own entity: no transactions needed
+    puts = []
+    deletes = []
+    for token in set(old) | set(new):
+        if old.get(token) == new.get(token):
+            continue
+        if token in new:
+            puts.append(SearchPosting(
+                key=_postingKey(kind, token, websafeKey),
+                token=_postingToken(kind, token), weight=new[token]))
+        else:
+            deletes.append(_postingKey(kind, token, websafeKey))
+    ndb.put_multi(puts)
+    ndb.delete_multi(deletes)
+
+    if new:
+        SearchDocument(id=websafeKey, tokens=new).put()
+    elif document:
+        document.key.delete()
+
+
+def search(kind, query, offset=0, limit=20):
+    """Return (ranked websafe keys, more) for the query.
+
+    Entities matching more of the query tokens rank first, ties are
+    broken by the summed field weights. Only the MAX_POSTINGS postings
+    with the highest weight are read per token.
+    """
+    tokens = sorted(set(tokenize(query)))
+    futures = []
+    for token in tokens:
+        postings = SearchPosting.query(
+            SearchPosting.token == _postingToken(kind, token))
+        futures.append(postings.order(-SearchPosting.weight).fetch_async(
+            MAX_POSTINGS, projection=[SearchPosting.weight]))
+    matched = {}
+    scores = {}
+    for future in futures:
+        for posting in future.get_result():
+            doc = _postingDoc(posting.key)
+            matched[doc] = matched.get(doc, 0) + 1
+            scores[doc] = scores.get(doc, 0) + posting.weight
+    ranked = sorted(matched,
+                    key=lambda doc: (-matched[doc], -scores[doc], doc))
+    return ranked[offset:offset + limit], len(ranked) > offset + limit
@@ -1,10 +1,15 @@
+import collections
 import json
 import os
 import time
 import uuid
 
+from google.appengine.api import memcache
 from google.appengine.api import urlfetch
+from google.appengine.ext import ndb
+from models import MEMCACHE_KIND_VERSION_TPL
 from models import Conference
+from models import Profile
 
 
 def getUserId(user, id_type="email"):
@@ -44,3 +49,88 @@ def getUserId(user, id_type="email"):
             return profile.id()
         else:
             return str(uuid.uuid1().get_hex())
+
+
+def getOrganizerNames(conferences):
+    """Return {organizerUserId: displayName} for the conferences."""
+    # get all keys and use get_multi for speed
+    organisers = [ndb.Key(Profile, conf.organizerUserId)
+                  for conf in conferences]
+    profiles = ndb.get_multi(organisers)
+
+    # put display names in a dict for easier fetching
+    names = {}
+    for profile in profiles:
+        if profile:
+            names[profile.key.id()] = profile.displayName
+    return names
+
+
+def getChangeToken(profile):
+    """Return '<profile version>.<conference version>.<session version>';
+    changes whenever the profile (incl. registrations & wishlist) or any
+    conference or session is put. The kind versions are memcache
+    counters (see models.bumpKindVersion), so the token costs one
+    memcache read besides the profile."""
+    keys = [MEMCACHE_KIND_VERSION_TPL % kind
+            for kind in ('Conference', 'Session')]
+    versions = memcache.get_multi(keys)
+    for key in keys:
+        if key not in versions:
+            # evicted or never bumped yet
+            memcache.add(key, int(time.time() * 1000))
+            versions[key] = memcache.get(key) or 0
+    return '%d.%d.%d' % ((profile.version if profile else 0,) +
+                         tuple(versions[key] for key in keys))
+
+
+def casUpdate(key, update, namespace=None, attempts=3):
+    """Replace a memcache value by update(value) (update(None) if there
+    is none) with compare-and-set; False if that failed `attempts`
+    times."""
+    client = memcache.Client()
+    for _ in range(attempts):
+        value = client.gets(key, namespace=namespace)
+        if value is None:
+            if client.add(key, update(None), namespace=namespace):
+                return True
+            continue
+        new_value = update(value)
+        if new_value == value or client.cas(key, new_value,
+                                            namespace=namespace):
+            return True
+    return False
+
+
+def deleteAll(query, batch=500):
+    """Delete the entities matching the query, `batch` at a time;
+    return how many were deleted."""
+    deleted = 0
+    while True:
+        keys = query.fetch(batch, keys_only=True)
+        ndb.delete_multi(keys)
+        deleted += len(keys)
+        if len(keys) < batch:
+            return deleted
+
+
+def formValues(form, entity):
+    """Return {name: value} of the form fields that carry data and are
+       properties of the entity, in field order."""
+    values = collections.OrderedDict()
+    for field in sorted(form.all_fields(), key=lambda field: field.number):
+        value = getattr(form, field.name)
+        if value not in (None, []) and field.name in entity._properties:
+            values[field.name] = value
+    return values
+
+
+def updateEntity(entity, values):
+    """Set the values that differ from the entity's; return True if any
+       did, i.e. if the entity needs to be written."""
+    changed = False
+    for name, value in values.items():
+        if getattr(entity, name) != value:
+            setattr(entity, name, value)
+            changed = True
+    return changed
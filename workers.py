@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+"""workers.py
+
+Cache maintenance & email logic run by the cron and task queue handlers
+in main.py (and used by the API in conference.py).
+
+Kept free of Cloud Endpoints and protorpc.remote imports so that cron and
+task instances start without loading the API stack.
+
+"""
+
+from datetime import date
+
+from google.appengine.api import app_identity
+from google.appengine.api import mail
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from models import Conference
+from models import FeaturedSpeaker
+
+from utils import getOrganizerNames
+
+MEMCACHE_ANNOUNCEMENTS_KEY = 'RECENT_ANNOUNCEMENTS'
+ANNOUNCEMENT_TPL = ('Last chance to attend! The following conferences '
+                    'are nearly sold out: %s')
+MEMCACHE_FEATURE_KEY = 'FEATURED_SPEAKER'
+FEATURED_SPEAKER_TPL = ('The featured speaker is: %s (Sessions: %s)')
+FEATURED_SPEAKER_ID = 'featured'
+MEMCACHE_UPCOMING_KEY = 'UPCOMING_CONFERENCE_LIST'
+UPCOMING_CONFERENCES_LIMIT = 50
+
+
+def cacheAnnouncement():
+    """Create Announcement & assign to memcache; used by
+    memcache cron job & warmup.
+    """
+    confs = Conference.query(ndb.AND(
+        Conference.archived == False,  # noqa
+        Conference.seatsAvailable <= 5,
+        Conference.seatsAvailable > 0)
+    ).fetch(projection=[Conference.name])
+
+    if confs:
+        # If there are almost sold out conferences,
+        # format announcement and set it in memcache
+        announcement = ANNOUNCEMENT_TPL % (
+            ', '.join(conf.name for conf in confs))
+        memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
+    else:
+        # If there are no sold out conferences,
+        # delete the memcache announcements entry
+        announcement = ""
+        memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
+
+    return announcement
+
+
+def cacheFeaturedSpeaker(speaker, sessions):
+    """Create Featured Speaker & assign to memcache"""
+    featured_speaker = FEATURED_SPEAKER_TPL % (speaker, sessions)
+    memcache.set(MEMCACHE_FEATURE_KEY, featured_speaker)
+    # keep it in the datastore to prime memcache on new instances
+    FeaturedSpeaker(id=FEATURED_SPEAKER_ID, speaker=speaker,
+                    sessions=sessions).put()
+    return sessions
+
+
+def primeFeaturedSpeaker():
+    """Restore the Featured Speaker in memcache from the datastore
+    if it is missing; used by warmup.
+    """
+    featured_speaker = memcache.get(MEMCACHE_FEATURE_KEY)
+    if featured_speaker is None:
+        featured = FeaturedSpeaker.get_by_id(FEATURED_SPEAKER_ID)
+        if featured:
+            featured_speaker = FEATURED_SPEAKER_TPL % (
+                featured.speaker, featured.sessions)
+            memcache.set(MEMCACHE_FEATURE_KEY, featured_speaker)
+    return featured_speaker
+
+
+def cacheUpcomingConferences():
+    """Create the list of upcoming (conference, organizer display name),
+    sorted by start date, & assign it to memcache; used by the
+    create/update task, cron & warmup.
+    """
+    confs = Conference.query(
+        Conference.startDate >= date.today()
+    ).order(Conference.startDate).fetch(UPCOMING_CONFERENCES_LIMIT)
+    names = getOrganizerNames(confs)
+    upcoming = [(conf, names.get(conf.organizerUserId)) for conf in confs]
+    memcache.set(MEMCACHE_UPCOMING_KEY, upcoming)
+    return upcoming
+
+
+def sendConfirmationEmail(email, conference_info):
+    """Send email confirming Conference creation."""
+    mail.send_mail(
+        'noreply@%s.appspotmail.com' % (
+            app_identity.get_application_id()),     # from
+        email,                                      # to
+        'You created a new Conference!',            # subj
+        'Hi, you have created a following '         # body
+        'conference:\r\n\r\n%s' % conference_info
+    )